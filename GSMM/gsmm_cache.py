@@ -0,0 +1,67 @@
+"""Load GSMMs from a pickle snapshot keyed by the SBML file's hash."""
+
+import hashlib
+import os
+import pickle
+import tempfile
+
+import cobra
+
+
+def file_hash(path):
+    digest = hashlib.sha1()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def _write_atomic(path, writer):
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(os.path.abspath(path)))
+    with os.fdopen(fd, 'wb') as f:
+        writer(f)
+    os.replace(tmp_path, path)
+
+
+def load_gsmm(sbml_path):
+    """Drop-in replacement for cobra.io.read_sbml_model(sbml_path).
+
+    The parsed model is pickled to <sbml_path>.cache.pickle together with
+    the SBML hash, and reused until the SBML content changes.
+    """
+    cache_path = sbml_path + '.cache.pickle'
+    sbml_hash = file_hash(sbml_path)
+    try:
+        with open(cache_path, 'rb') as f:
+            if pickle.load(f) == sbml_hash:
+                return pickle.load(f)
+    except (OSError, EOFError, pickle.UnpicklingError):
+        pass
+
+    model = cobra.io.read_sbml_model(sbml_path)
+
+    def writer(f):
+        pickle.dump(sbml_hash, f, pickle.HIGHEST_PROTOCOL)
+        pickle.dump(model, f, pickle.HIGHEST_PROTOCOL)
+    _write_atomic(cache_path, writer)
+    return model
+
+
+def export_sbml(sbml_path, target_path):
+    """Write the model in sbml_path to target_path through cobra.
+
+    Skipped when target_path was already exported from the same SBML and
+    has not been touched since; the hashes are kept in <target_path>.sha1.
+    Returns True if the file was (re)written.
+    """
+    stamp_path = target_path + '.sha1'
+    source_hash = file_hash(sbml_path)
+    if os.path.isfile(target_path) and os.path.isfile(stamp_path):
+        with open(stamp_path) as f:
+            if f.read().split() == [source_hash, file_hash(target_path)]:
+                return False
+
+    cobra.io.write_sbml_model(load_gsmm(sbml_path), target_path)
+    with open(stamp_path, 'w') as f:
+        f.write('{} {}\n'.format(source_hash, file_hash(target_path)))
+    return True
@@ -0,0 +1,125 @@
+"""Flux variability and single-gene-deletion screens of the GSMM under forced acetate secretion."""
+
+import multiprocessing
+import os
+
+import cobra
+import numpy as np
+import pandas as pd
+
+from gsmm_cache import load_gsmm
+
+SBML = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'iLC858_v1.1.sbml')
+
+# The acetate secretion forced in OAD_tradeoff.py
+FORCED_BOUNDS = {'rxn05488_c': (-1000, -23.3)}
+
+# Every worker process gets the model once and reverts each deletion after solving
+_worker_model = None
+
+
+def load_constrained(sbml_path=SBML, bounds=FORCED_BOUNDS):
+    """The GSMM with the GLPK solver and the given reaction bounds applied."""
+    model = load_gsmm(sbml_path)
+    model.solver = 'glpk'
+    for rxn_id, rxn_bounds in bounds.items():
+        model.reactions.get_by_id(rxn_id).bounds = rxn_bounds
+    return model
+
+
+def run_fva(model, reactions=None, fraction_of_optimum=1.0, processes=None):
+    """Flux variability of model (e.g. from load_constrained) across a process pool.
+
+    cobra's own FVA already ships the model to every worker once and
+    splits the reactions between them. Returns a DataFrame indexed by
+    reaction with the columns minimum and maximum.
+    """
+    return cobra.flux_analysis.flux_variability_analysis(
+        model, reaction_list=reactions, fraction_of_optimum=fraction_of_optimum, processes=processes)
+
+
+def deletion_groups(model, genes=None):
+    """Group genes by the set of reactions their deletion disables.
+
+    A reaction is disabled when its GPR rule evaluates to False without
+    the gene. Returns a dict mapping each frozenset of reaction ids to the
+    list of gene ids that give it; genes without effect map to the empty
+    set.
+    """
+    genes = model.genes if genes is None else [model.genes.get_by_id(g) for g in genes]
+    groups = {}
+    for gene in genes:
+        disabled = frozenset(r.id for r in gene.reactions if not r.gpr.eval({gene.id}))
+        groups.setdefault(disabled, []).append(gene.id)
+    return groups
+
+
+def _init_worker(model):
+    global _worker_model
+    _worker_model = model
+
+
+# Knocking out reactions can only lower the optimum, so a plain FBA growth
+# rate is enough here: loopless solutions share the FBA objective value.
+def _solve_deletion(task):
+    index, reactions = task
+    with _worker_model:
+        for rxn_id in reactions:
+            _worker_model.reactions.get_by_id(rxn_id).knock_out()
+        # NaN, not 0: with the forced bounds an infeasible deletion is not a lethal one
+        growth = _worker_model.slim_optimize(error_value=np.nan)
+    return index, growth
+
+
+def gene_deletion_screen(model, output_file=None, genes=None, processes=None):
+    """Growth of every single-gene deletion of model, solving each distinct reaction set once.
+
+    Genes whose deletions disable the same reactions share one solve (see
+    deletion_groups); deletions that disable nothing are not solved. When
+    output_file is given, the table is also written there as CSV. Returns
+    a DataFrame indexed by gene with the columns group (one id per
+    reaction set), n_reactions, growth and growth_ratio (relative to the
+    unperturbed model). Deletions that make the model infeasible under its
+    forced bounds have NaN growth, so they stay apart from lethal ones
+    (growth 0).
+    """
+    wt_growth = model.slim_optimize(error_value=np.nan)
+    groups = list(deletion_groups(model, genes).items())
+    tasks = [(i, sorted(reactions)) for i, (reactions, _) in enumerate(groups) if reactions]
+    growth = np.full(len(groups), wt_growth)
+
+    if tasks:
+        pool = multiprocessing.Pool(processes, initializer=_init_worker, initargs=(model,))
+        try:
+            for index, value in pool.imap_unordered(_solve_deletion, tasks):
+                growth[index] = value
+        finally:
+            pool.close()
+            pool.join()
+
+    rows = []
+    for i, (reactions, gene_ids) in enumerate(groups):
+        for gene_id in gene_ids:
+            rows.append((gene_id, i, len(reactions), growth[i]))
+    table = pd.DataFrame(rows, columns=['gene', 'group', 'n_reactions', 'growth']).set_index('gene')
+    table['growth_ratio'] = table['growth'] / wt_growth if wt_growth else np.nan
+    table = table.astype({'group': np.int32, 'n_reactions': np.int32, 'growth': np.float32,
+                          'growth_ratio': np.float32})
+
+    if output_file is not None:
+        table.to_csv(output_file)
+    return table
+
+
+def main():
+    model = load_constrained()
+    fva = run_fva(model)
+    fva.to_csv('gsmm_fva.csv')
+    table = gene_deletion_screen(model, 'gsmm_gene_deletions.csv')
+    print('{} genes, {} distinct reaction sets solved'.format(len(table), table.loc[table['n_reactions'] > 0, 'group'].nunique()))
+    print('{} deletions infeasible'.format(table['growth'].isna().sum()))
+    print(table.sort_values('growth_ratio').head(20))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,114 @@
+"""Loopless FBA that precomputes the internal cycles of a model once.
+
+Running this file checks LooplessFBA against cobra's loopless_solution on
+the salmonella and iJO1366 models that ship with cobra (or on the SBML
+files given as arguments):
+
+    python loopless_fba.py [model.sbml ...]
+"""
+
+import sys
+
+import cobra
+import numpy as np
+import pandas as pd
+from scipy.linalg import null_space
+from scipy.optimize import linprog
+from cobra.flux_analysis import loopless_solution
+
+# Reactions knocked out one at a time by check_against_cobra, where the model has them
+CHECK_KNOCKOUTS = ('PGI', 'PFK', 'TPI', 'GND', 'CS', 'ATPS4rpp')
+
+
+class LooplessFBA(object):
+    """Repeated loopless solutions for one model under changing bounds.
+
+    Gives the same answer as cobra.flux_analysis.loopless.loopless_solution
+    (CycleFreeFlux). The flux removed by CycleFreeFlux is always a
+    combination of internal cycles, i.e. it lies in the null space of the
+    internal (non-boundary) reactions. That null space depends only on the
+    stoichiometry, so it is computed once here. Each optimize() is then the
+    model's own FBA solve, which the solver warm-starts after bound changes,
+    plus a small LP over the cycle coefficients instead of a second LP over
+    the whole network.
+    """
+
+    def __init__(self, model, zero_tol=1e-9):
+        self.model = model
+        self.zero_tol = zero_tol
+        internal = [i for i, r in enumerate(model.reactions) if not r.boundary]
+        S = cobra.util.create_stoichiometric_matrix(model, array_type='dense')
+        cycles = null_space(S[:, internal])
+        # only reactions that take part in a cycle can change between FBA and loopless
+        support = np.any(np.abs(cycles) > zero_tol, axis=1)
+        self.loop_reactions = [model.reactions[internal[i]].id for i in np.flatnonzero(support)]
+        self.cycles = cycles[support]
+
+    def optimize(self):
+        """Loopless optimum under the model's current bounds, as a cobra Solution."""
+        sol = self.model.optimize()
+        if sol.status != 'optimal' or not self.loop_reactions:
+            return sol
+
+        N = self.cycles
+        v = sol.fluxes[self.loop_reactions].values
+        reactions = [self.model.reactions.get_by_id(r) for r in self.loop_reactions]
+        lb = np.array([r.lower_bound for r in reactions], dtype=float)
+        ub = np.array([r.upper_bound for r in reactions], dtype=float)
+        c = np.array([r.objective_coefficient for r in reactions], dtype=float)
+        sign = np.where(v >= 0, 1.0, -1.0)
+
+        # loopless fluxes are v + N a. Like CycleFreeFlux, keep each flux
+        # between 0 and its FBA value (so |v + N a| <= |v|, and fluxes that
+        # were 0 stay 0) and within its bounds, keep the objective, and
+        # minimise sum |flux|
+        A_ub = np.vstack([-sign[:, None] * N, sign[:, None] * N, N, -N, -c[None, :].dot(N)])
+        b_ub = np.concatenate([sign * v, np.zeros(len(v)), ub - v, v - lb, [0.0]])
+        finite = np.isfinite(b_ub)
+        res = linprog(N.T.dot(sign), A_ub=A_ub[finite], b_ub=b_ub[finite],
+                      bounds=(None, None), method='highs')
+        if res.status != 0:
+            return sol
+
+        fluxes = sol.fluxes.copy()
+        fluxes[self.loop_reactions] = v + N.dot(res.x)
+        objective_value = sum(r.objective_coefficient * fluxes[r.id]
+                              for r in self.model.reactions if r.objective_coefficient)
+        return cobra.Solution(objective_value, 'optimal', fluxes)
+
+
+def check_against_cobra(model, knockouts=CHECK_KNOCKOUTS):
+    """Compare LooplessFBA with loopless_solution on model and its single knockouts.
+
+    Knockouts the model does not have are skipped. Returns a DataFrame
+    indexed by scenario ('none' for the unperturbed model) with both
+    objective values, both total absolute fluxes and the largest flux
+    difference.
+    """
+    loopless = LooplessFBA(model)
+    rows = {}
+    for knockout in ('none',) + tuple(k for k in knockouts if k in model.reactions):
+        with model:
+            if knockout != 'none':
+                model.reactions.get_by_id(knockout).knock_out()
+            ours, theirs = loopless.optimize(), loopless_solution(model)
+        rows[knockout] = (ours.objective_value, theirs.objective_value, ours.fluxes.abs().sum(),
+                          theirs.fluxes.abs().sum(), (ours.fluxes - theirs.fluxes).abs().max())
+    return pd.DataFrame.from_dict(rows, orient='index', columns=[
+        'objective', 'cobra_objective', 'total_flux', 'cobra_total_flux', 'max_flux_difference'])
+
+
+def main(tol=1e-6):
+    failed = False
+    for source in sys.argv[1:] or ['salmonella', 'iJO1366']:
+        model = cobra.io.read_sbml_model(source) if source.endswith(('.xml', '.sbml')) else cobra.io.load_model(source)
+        model.solver = 'glpk'
+        table = check_against_cobra(model)
+        print(source)
+        print(table)
+        failed |= bool((table['max_flux_difference'] > tol).any())
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,284 @@
+"""Apply declarative GSMM patches (YAML or JSON) to a cobra model in one validated batch.
+
+A patch is a mapping with any of these sections, applied in this order:
+
+    remove_reactions: [rxn27735_c, ...]
+    metabolites:                      # new metabolites
+      - {id: cpd15511_c, name: ..., formula: ..., compartment: c}
+    add_reactions:
+      - id: rxn01453_c
+        name: ...
+        metabolites: {cpd00006_c: -1, cpd02234_c: -1, ...}
+        bounds: [-1000, 1000]
+        gene_reaction_rule: PN96_18045
+    update_reactions:
+      - id: rxn00288_c
+        metabolites: {...}            # replaces the stoichiometry
+        add_metabolites: {...}        # added to the stoichiometry
+        bounds: [0, 1000]
+        gene_reaction_rule: ...
+        name: ...
+        name_suffix: ...              # appended to the current name
+
+Usage:
+    python model_patch.py iLC858.sbml updates/update_v1.1.yaml -o iLC858_v1.1.sbml
+"""
+
+import argparse
+import contextlib
+import functools
+import json
+import numbers
+import warnings
+
+import cobra
+from cobra import Metabolite, Reaction
+from cobra.core.gene import GPR
+from cobra.util.context import get_context
+
+try:
+    import yaml
+except ImportError:
+    yaml = None
+
+SECTIONS = ('remove_reactions', 'metabolites', 'add_reactions', 'update_reactions')
+METABOLITE_KEYS = {'id', 'name', 'formula', 'compartment', 'charge'}
+ADD_KEYS = {'id', 'name', 'metabolites', 'bounds', 'gene_reaction_rule', 'subsystem'}
+UPDATE_KEYS = {'id', 'name', 'name_suffix', 'metabolites', 'add_metabolites', 'bounds', 'gene_reaction_rule',
+               'subsystem'}
+
+
+class PatchError(ValueError):
+    """A patch that does not fit the model; lists every problem found."""
+
+    def __init__(self, problems):
+        self.problems = list(problems)
+        super(PatchError, self).__init__('invalid patch:\n  ' + '\n  '.join(self.problems))
+
+
+def load_patch(path):
+    """Read a patch from a .json or .yaml/.yml file."""
+    with open(path) as f:
+        if path.endswith('.json'):
+            return json.load(f)
+        if yaml is None:
+            raise ImportError('PyYAML is required to read {}'.format(path))
+        return yaml.safe_load(f) or {}
+
+
+# A real number, not NaN; bool is an int subclass, but True/False in a patch is a typo
+def _is_number(value):
+    return isinstance(value, numbers.Real) and not isinstance(value, bool) and value == value
+
+
+def _check_bounds(where, bounds, problems):
+    if (not isinstance(bounds, (list, tuple)) or len(bounds) != 2 or not all(_is_number(b) for b in bounds)
+            or bounds[0] > bounds[1]):
+        problems.append('{}: bounds must be numbers [lower, upper] with lower <= upper, got {}'
+                        .format(where, bounds))
+
+
+# cobra only warns about a malformed rule (and leaves the GPR empty)
+def _check_gpr(where, rule, problems):
+    with warnings.catch_warnings(record=True) as caught:
+        warnings.simplefilter('always')
+        GPR.from_string(rule)
+    if any(issubclass(w.category, SyntaxWarning) for w in caught):
+        problems.append('{}: invalid gene_reaction_rule {!r}'.format(where, rule))
+
+
+def _check_metabolites(where, stoichiometry, known, problems):
+    for met_id, coefficient in stoichiometry.items():
+        if met_id not in known:
+            problems.append('{}: unknown metabolite {}'.format(where, met_id))
+        if not _is_number(coefficient):
+            problems.append('{}: coefficient of {} is not a number'.format(where, met_id))
+
+
+def validate_patch(model, patch):
+    """Check patch against model without changing it; raises PatchError listing all problems."""
+    problems = []
+    unknown = set(patch) - set(SECTIONS) - {'description'}
+    if unknown:
+        problems.append('unknown sections: {}'.format(', '.join(sorted(unknown))))
+
+    reactions = set(r.id for r in model.reactions)
+    removed = set()
+    for rxn_id in patch.get('remove_reactions', []):
+        if rxn_id not in reactions:
+            problems.append('remove_reactions: unknown reaction {}'.format(rxn_id))
+        if rxn_id in removed:
+            problems.append('remove_reactions: {} listed twice'.format(rxn_id))
+        removed.add(rxn_id)
+
+    metabolites = set(m.id for m in model.metabolites)
+    for met in patch.get('metabolites', []):
+        where = 'metabolites: {}'.format(met.get('id'))
+        if set(met) - METABOLITE_KEYS:
+            problems.append('{}: unknown keys {}'.format(where, ', '.join(sorted(set(met) - METABOLITE_KEYS))))
+        if 'id' not in met:
+            problems.append('metabolites: entry without id')
+        elif met['id'] in metabolites:
+            problems.append('{}: already in the model'.format(where))
+        metabolites.add(met.get('id'))
+
+    added = set()
+    for rxn in patch.get('add_reactions', []):
+        where = 'add_reactions: {}'.format(rxn.get('id'))
+        if set(rxn) - ADD_KEYS:
+            problems.append('{}: unknown keys {}'.format(where, ', '.join(sorted(set(rxn) - ADD_KEYS))))
+        if 'id' not in rxn:
+            problems.append('add_reactions: entry without id')
+        elif (rxn['id'] in reactions and rxn['id'] not in removed) or rxn['id'] in added:
+            problems.append('{}: already in the model'.format(where))
+        added.add(rxn.get('id'))
+        if not rxn.get('metabolites'):
+            problems.append('{}: no metabolites'.format(where))
+        _check_metabolites(where, rxn.get('metabolites', {}), metabolites, problems)
+        if 'bounds' in rxn:
+            _check_bounds(where, rxn['bounds'], problems)
+        if 'gene_reaction_rule' in rxn:
+            _check_gpr(where, rxn['gene_reaction_rule'], problems)
+
+    updated = set()
+    for rxn in patch.get('update_reactions', []):
+        where = 'update_reactions: {}'.format(rxn.get('id'))
+        if set(rxn) - UPDATE_KEYS:
+            problems.append('{}: unknown keys {}'.format(where, ', '.join(sorted(set(rxn) - UPDATE_KEYS))))
+        if rxn.get('id') not in reactions or rxn.get('id') in removed:
+            problems.append('{}: not in the model'.format(where))
+        if rxn.get('id') in updated:
+            problems.append('{}: updated twice'.format(where))
+        updated.add(rxn.get('id'))
+        if 'name' in rxn and 'name_suffix' in rxn:
+            problems.append('{}: name and name_suffix are exclusive'.format(where))
+        for key in ('metabolites', 'add_metabolites'):
+            _check_metabolites(where, rxn.get(key, {}), metabolites, problems)
+        if 'bounds' in rxn:
+            _check_bounds(where, rxn['bounds'], problems)
+        if 'gene_reaction_rule' in rxn:
+            _check_gpr(where, rxn['gene_reaction_rule'], problems)
+
+    if problems:
+        raise PatchError(problems)
+
+
+def _new_stoichiometry(reaction, entry):
+    """Stoichiometry change of an update entry, as metabolite id -> coefficient delta."""
+    current = {m.id: c for m, c in reaction.metabolites.items()}
+    final = dict(entry['metabolites']) if 'metabolites' in entry else dict(current)
+    for met_id, coefficient in entry.get('add_metabolites', {}).items():
+        final[met_id] = final.get(met_id, 0) + coefficient
+    delta = {}
+    for met_id in set(current) | set(final):
+        change = final.get(met_id, 0) - current.get(met_id, 0)
+        if change != 0:
+            delta[met_id] = change
+    return delta
+
+
+# Changes made in the block are undone if it raises. Otherwise they are kept,
+# and their undo steps move to the enclosing `with model:` block, if any.
+@contextlib.contextmanager
+def _undo_on_error(model):
+    model.__enter__()
+    try:
+        yield
+    except BaseException:
+        model.__exit__(None, None, None)
+        raise
+    context = model._contexts.pop()
+    outer = get_context(model)
+    if outer is not None:
+        for undo in context._history:
+            outer(undo)
+
+
+# cobra does not record name or subsystem changes in a model context
+def _set_undoable(obj, attribute, value):
+    context = get_context(obj)
+    if context is not None:
+        context(functools.partial(setattr, obj, attribute, getattr(obj, attribute)))
+    setattr(obj, attribute, value)
+
+
+def apply_patch(model, patch, validate=True):
+    """Apply patch to model in place.
+
+    The patch is validated first, so a bad patch leaves the model
+    untouched, and if applying it still fails part-way the changes made so
+    far are undone before the error is raised. Removals, new metabolites
+    and new reactions each go to the model in a single call, and every
+    updated reaction gets at most one stoichiometry change. Inside a
+    `with model:` block the whole patch is undone on exit, e.g. to screen
+    candidate patches:
+
+        with model:
+            apply_patch(model, patch)
+            growth = model.slim_optimize()
+    """
+    if validate:
+        validate_patch(model, patch)
+
+    with _undo_on_error(model):
+        _apply(model, patch)
+    return model
+
+
+def _apply(model, patch):
+    if patch.get('remove_reactions'):
+        model.remove_reactions([model.reactions.get_by_id(r) for r in patch['remove_reactions']])
+
+    if patch.get('metabolites'):
+        model.add_metabolites([Metabolite(m['id'], formula=m.get('formula'), name=m.get('name', ''),
+                                          compartment=m.get('compartment'), charge=m.get('charge'))
+                               for m in patch['metabolites']])
+
+    new_reactions = []
+    for entry in patch.get('add_reactions', []):
+        reaction = Reaction(entry['id'], name=entry.get('name', ''), subsystem=entry.get('subsystem', ''))
+        reaction.add_metabolites({model.metabolites.get_by_id(m): c for m, c in entry['metabolites'].items()})
+        if 'bounds' in entry:
+            reaction.bounds = tuple(entry['bounds'])
+        if 'gene_reaction_rule' in entry:
+            reaction.gene_reaction_rule = entry['gene_reaction_rule']
+        new_reactions.append(reaction)
+    if new_reactions:
+        model.add_reactions(new_reactions)
+
+    for entry in patch.get('update_reactions', []):
+        reaction = model.reactions.get_by_id(entry['id'])
+        if 'metabolites' in entry or 'add_metabolites' in entry:
+            delta = _new_stoichiometry(reaction, entry)
+            if delta:
+                reaction.add_metabolites({model.metabolites.get_by_id(m): c for m, c in delta.items()})
+        if 'bounds' in entry:
+            reaction.bounds = tuple(entry['bounds'])
+        if 'gene_reaction_rule' in entry:
+            reaction.gene_reaction_rule = entry['gene_reaction_rule']
+        if 'name' in entry:
+            _set_undoable(reaction, 'name', entry['name'])
+        if 'name_suffix' in entry:
+            _set_undoable(reaction, 'name', reaction.name + entry['name_suffix'])
+        if 'subsystem' in entry:
+            _set_undoable(reaction, 'subsystem', entry['subsystem'])
+
+    model.solver.update()
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Apply GSMM patches to an SBML model.')
+    parser.add_argument('sbml')
+    parser.add_argument('patches', nargs='+')
+    parser.add_argument('-o', '--output', required=True)
+    args = parser.parse_args()
+
+    from gsmm_cache import load_gsmm
+    model = load_gsmm(args.sbml)
+    for path in args.patches:
+        apply_patch(model, load_patch(path))
+    cobra.io.write_sbml_model(model, args.output)
+
+
+if __name__ == '__main__':
+    main()
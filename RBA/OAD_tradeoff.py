@@ -3,36 +3,43 @@ from __future__ import absolute_import, division, print_function
 import os
 import sys
 sys.path.append("/Users/lucascoppens/Documents/Phd/Active/Vnat modelling/Vnat_v5/RBA/RBApy")
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "GSMM"))
 import rba
 
 # package imports
 import re
 import cobra
 import matplotlib.pyplot as plt 
-from cobra.flux_analysis.loopless import loopless_solution
+from loopless_fba import LooplessFBA
+from gsmm_cache import load_gsmm
 import numpy as np
+from model_cache import load_model
+from warm_solver import WarmStartSolver
+from efficiency_index import EfficiencyIndex
 
 
 def main():
-    RBA = rba.RbaModel.from_xml("model")
-    GEM = cobra.io.read_sbml_model('/Users/lucascoppens/Documents/Phd/Active/Vnat modelling/Vnat_v5/github_repo/GSMM/iLC858_v1.1.sbml')
+    RBA = load_model("model")
+    GEM = load_gsmm('/Users/lucascoppens/Documents/Phd/Active/Vnat modelling/Vnat_v5/github_repo/GSMM/iLC858_v1.1.sbml')
     GEM.solver = 'glpk'
 
     # Get FBA WT growth
+    loopless = LooplessFBA(GEM)
     GEM.reactions.get_by_id("rxn05488_c").bounds=(-1000, -23.3) # ensure acetate secretion
-    GEM_WT_growth = loopless_solution(GEM).objective_value
+    GEM_WT_growth = loopless.optimize().objective_value
 
     # Get FBA Na-OAD KO growth
     GEM.reactions.get_by_id("rxn30509_c").bounds=(0, 0)
-    GEM_NaOad_growth = loopless_solution(GEM).objective_value
+    GEM_NaOad_growth = loopless.optimize().objective_value
 
     # Get RBA WT growth
-    RBA_WT_growth = RBA.solve().mu_opt
+    solver = WarmStartSolver(RBA)
+    RBA_WT_growth = solver.solve().mu_opt
 
-    # Get RBA Na-OAD KO growth
-    RBA.set_enzyme_efficiencies('kapp_NaOAD_KO.tsv')
+    # Get RBA Na-OAD KO growth, starting the search below the WT optimum
+    EfficiencyIndex(RBA).update_from_file('kapp_NaOAD_KO.tsv')
 
-    RBA_NaOad_growth = RBA.solve().mu_opt
+    RBA_NaOad_growth = solver.solve(bracket=(0, RBA_WT_growth)).mu_opt
 
     plot_bar(GEM_WT_growth, GEM_NaOad_growth, RBA_WT_growth, RBA_NaOad_growth)
 
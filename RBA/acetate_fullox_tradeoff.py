@@ -9,45 +9,31 @@ import rba
 import re
 import cobra
 import matplotlib.pyplot as plt 
-
-tca_resp_reactions = [
-        "rxn00256_c",
-        "rxn00973_c",
-        "rxn00198_c",
-        "rxn08094_c",
-        "rxn00285_c",
-        "rxn00288_c",
-        "rxn00799_c",
-        "rxn00935_c",
-        "rxn10042_c", # ATP synthase
-        # "rxn30509_c", # Na-OAD
-        "rxn37569_c", # Na-NQR
-        "rxn10113_c", # cytochrome bo3
-        "rxn10806_c", # cytochrome bd
-        "rxn14426_c", # cytochrome cbb3
-        "rxn35348_c", # cytochrome bc1
-        "rxn19357_c", # cytochrome aa3
-    ]
+from matplotlib.ticker import FuncFormatter
+from adaptive_scan import adaptive_scan
+from result_store import ResultStore
+from model_cache import load_model
+from efficiency_index import EfficiencyIndex
+from reaction_sets import tca_resp_reactions
 
 
 def main():
-    model = rba.RbaModel.from_xml("model")
-
-    efficiencies = list(range(100000, 1000000, 100000))
-    acetate_secretions = []
-    ATP_synthases = []
-    growth_rates = []
-    for efficiency in efficiencies:
-        for enz in model.enzymes.enzymes:
-            if enz.id[2:12] in tca_resp_reactions:
-                model.parameters.functions.get_by_id(enz.id+"_forward_efficiency").parameters.get_by_id('CONSTANT').value = efficiency
-                model.parameters.functions.get_by_id(enz.id+"_backward_efficiency").parameters.get_by_id('CONSTANT').value = efficiency
-
-        sol = model.solve(bissection_tol = 0.001)
-        rf = sol.reaction_fluxes()
-        acetate_secretions.append(abs(rf["R_rxn05488_c"]))
-        ATP_synthases.append(abs(rf["R_rxn10042_c"]))
-        growth_rates.append(sol.mu_opt)
+    model = load_model("model")
+
+    efficiency_functions = EfficiencyIndex(model).function_ids(tca_resp_reactions)
+
+    # refine the efficiency grid where growth or the monitored fluxes change quickly;
+    # the full solutions go to a result store (replacing the previous run's) and the
+    # plot columns are read back from it
+    adaptive_scan(lambda efficiency: dict.fromkeys(efficiency_functions, efficiency), 100000, 900000,
+                  fluxes=["R_rxn05488_c", "R_rxn10042_c"], tol=0.05, store="acetate_fullox_tradeoff.results",
+                  overwrite=True, bissection_tol = 0.001)
+    table = ResultStore("acetate_fullox_tradeoff.results").read(["t", "mu_opt", "R_rxn05488_c", "R_rxn10042_c"])
+    table = table.sort_values("t")
+    efficiencies = list(table["t"])
+    acetate_secretions = list(table["R_rxn05488_c"].abs())
+    ATP_synthases = list(table["R_rxn10042_c"].abs())
+    growth_rates = list(table["mu_opt"])
     
     plot_results(efficiencies, acetate_secretions, ATP_synthases, growth_rates)
 
@@ -61,7 +47,7 @@ def plot_results(efficiencies, acetate_secretions, ATP_synthases, growth_rates):
     ax1.set_xlabel('TCA & respiratory complexes catalytic rate (*100000$h^{-1}$)', fontsize=16.5)
     ax1.set_ylabel('Growth rate ($h^{-1}$)', fontsize=16.5)
     line1, = ax1.plot(efficiencies, growth_rates, color=color, linewidth=2, label = "Growth rate")
-    ax1.set_xticklabels([f"{x/100000:.1f}" for x in efficiencies])
+    ax1.xaxis.set_major_formatter(FuncFormatter(lambda x, pos: f"{x/100000:.1f}"))
 
     ax2 = ax1.twinx()
 
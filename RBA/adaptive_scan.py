@@ -0,0 +1,82 @@
+"""Scan a one-parameter path, refining only where the solution changes quickly."""
+
+from __future__ import absolute_import, division, print_function
+
+# package imports
+import numpy as np
+import pandas as pd
+from sweep import SweepPool, iter_sweep, PROFILE_COLUMNS
+from result_store import ResultSink
+
+
+def _intervals_to_refine(table, columns, tol, min_step):
+    """Indices i such that the interval between rows i and i+1 needs a midpoint."""
+    t = table['t'].values
+    refine = np.zeros(len(t) - 1, dtype=bool)
+    for column in columns:
+        values = table[column].values
+        finite = values[np.isfinite(values)]
+        scale = np.ptp(finite) if len(finite) else 0.0
+        if scale == 0:
+            scale = max(np.max(np.abs(finite)) if len(finite) else 0.0, 1.0)
+        step = np.abs(np.diff(values)) / scale
+        # a point turning infeasible is always worth resolving
+        nan_edge = np.diff(np.isnan(values).astype(int)) != 0
+        refine |= (step > tol) | nan_edge
+    return np.flatnonzero(refine & (np.diff(t) > min_step))
+
+
+def adaptive_scan(path, t_min, t_max, fluxes=(), tol=0.05, initial_points=5, max_rounds=6,
+                  min_step=None, model_dir="model", processes=None, warm_start=True, store=None,
+                  overwrite=False, profile=False, **solve_kwargs):
+    """Solve along path(t) for t in [t_min, t_max] on an adaptively refined grid.
+
+    path maps the scalar t to a sweep assignment (see sweep.run_sweep), e.g.
+    lambda t: dict.fromkeys(efficiency_functions, t). The scan starts from
+    initial_points evenly spaced values. Each round then bisects every
+    interval over which mu_opt or one of the fluxes changes by more than
+    tol, relative to that column's range over the points solved so far.
+    Rounds stop when nothing needs refining, after max_rounds, or when
+    intervals get shorter than min_step (default: (t_max - t_min) / 1000).
+    All rounds run on one SweepPool, so every worker loads and compiles the
+    model once for the whole scan. With store (a directory), every point's
+    full solution is streamed into a result_store with t as label; an
+    existing store is only replaced with overwrite. Returns
+    a DataFrame sorted by t with the columns t, mu_opt and the fluxes,
+    followed by sweep.PROFILE_COLUMNS with profile (requires warm_start).
+    """
+    fluxes = list(fluxes)
+    if min_step is None:
+        min_step = (t_max - t_min) / 1000
+    columns = ['mu_opt'] + fluxes
+    table_columns = columns + (PROFILE_COLUMNS if profile else [])
+
+    with SweepPool(model_dir, processes) as pool:
+        sink = (ResultSink.for_model(store, pool.model, labels=['t'], overwrite=overwrite)
+                if store is not None else None)
+
+        def solve(ts):
+            rows = [None] * len(ts)
+            for index, row in iter_sweep([path(t) for t in ts], fluxes, warm_start=warm_start, profile=profile,
+                                         vectors=sink is not None, pool=pool, **solve_kwargs):
+                vectors = row.pop('_vectors', None)
+                if sink is not None:
+                    sink.append_vectors(row['mu_opt'], vectors, t=ts[index])
+                rows[index] = row
+            table = pd.DataFrame(rows, columns=table_columns)
+            table.insert(0, 't', ts)
+            return table
+
+        try:
+            table = solve(list(np.linspace(t_min, t_max, initial_points)))
+            for _ in range(max_rounds):
+                intervals = _intervals_to_refine(table, columns, tol, min_step)
+                if not len(intervals):
+                    break
+                t = table['t'].values
+                midpoints = list((t[intervals] + t[intervals + 1]) / 2)
+                table = pd.concat([table, solve(midpoints)]).sort_values('t').reset_index(drop=True)
+        finally:
+            if sink is not None:
+                sink.close()
+    return table
@@ -0,0 +1,279 @@
+"""Benchmark the RBA and GSMM solve paths and write the results as JSON.
+
+Usage (from the RBA directory):
+
+    python benchmark.py -o bench.json               # all scenarios
+    python benchmark.py -o bench.json solve sweep   # selected scenarios
+    python benchmark.py --compare old.json new.json
+
+Every scenario runs in a fresh interpreter so peak RSS and load times are
+not polluted by the previous one.
+"""
+
+from __future__ import absolute_import, division, print_function
+
+import os
+import sys
+sys.path.append("/Users/lucascoppens/Documents/Phd/Active/Vnat modelling/Vnat_v5/RBA/RBApy")
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "GSMM"))
+import rba
+
+# package imports
+import argparse
+import collections
+import datetime
+import json
+import platform
+import resource
+import subprocess
+import time
+
+GEM_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "GSMM", "iLC858_v1.1.sbml")
+
+
+class SolveCounter(object):
+    """Count growth-rate solves, LP solves and bisection iterations while active.
+
+    LPs are counted where they are solved: LinearProblem.solve for
+    WarmStartSolver (and everything built on it) and solve_lp of rba's LP
+    solver classes for RbaModel.solve. A WarmStartSolver reports its own
+    bisection iterations; in RbaModel.solve every LP after the mu_min
+    check is one. Solves in worker processes are added from their
+    SolveProfiles with add_profiles().
+    """
+
+    def __init__(self):
+        self.solves = 0
+        self.lp_solves = 0
+        self.bisection_iterations = 0
+        self._patched = []
+
+    # Replace owner.name by a wrapper that calls count(instance, LPs solved during the call)
+    def _wrap(self, owner, name, count):
+        original = getattr(owner, name)
+
+        def wrapper(instance, *args, **kwargs):
+            start = self.lp_solves
+            result = original(instance, *args, **kwargs)
+            count(instance, self.lp_solves - start)
+            return result
+        setattr(owner, name, wrapper)
+        self._patched.append((owner, name, original))
+
+    def _count_lp(self, instance, nested):
+        self.lp_solves += 1
+
+    def _count_rba_solve(self, model, lps):
+        self.solves += 1
+        self.bisection_iterations += max(lps - 1, 0)
+
+    def _count_warm_solve(self, solver, lps):
+        self.solves += 1
+        self.bisection_iterations += solver.n_bisection_iters
+
+    def add_profiles(self, table):
+        """Add the solves of a profiled sweep table (sweep.PROFILE_COLUMNS) run in worker processes."""
+        self.solves += len(table)
+        self.lp_solves += int(table['n_lp'].sum())
+        self.bisection_iterations += int(table['n_bisection_iters'].sum())
+
+    def __enter__(self):
+        from warm_solver import WarmStartSolver, LinearProblem
+        lp_module = sys.modules[rba.Solver.__module__]
+        for lp_class in vars(lp_module).values():
+            if isinstance(lp_class, type) and 'solve_lp' in vars(lp_class):
+                self._wrap(lp_class, 'solve_lp', self._count_lp)
+        self._wrap(LinearProblem, 'solve', self._count_lp)
+        self._wrap(rba.RbaModel, 'solve', self._count_rba_solve)
+        self._wrap(WarmStartSolver, 'solve', self._count_warm_solve)
+        return self
+
+    def __exit__(self, *exc):
+        for owner, name, original in reversed(self._patched):
+            setattr(owner, name, original)
+        self._patched = []
+
+
+# Scenarios. Each gets the active SolveCounter and returns a dict of result
+# values worth tracking alongside the timings.
+
+def bench_load(counter):
+    """Parse the XML model directory (no snapshot)."""
+    rba.RbaModel.from_xml("model")
+    return {}
+
+
+def bench_load_cached(counter):
+    """Load the model through model_cache (snapshot written first if missing)."""
+    from model_cache import load_model
+    load_model("model")
+    return {}
+
+
+def bench_solve(counter):
+    """solve_model.py: one WarmStartSolver solve."""
+    from model_cache import load_model
+    from warm_solver import WarmStartSolver
+    model = load_model("model")
+    return {'mu_opt': WarmStartSolver(model).solve(bissection_tol=0.01).mu_opt}
+
+
+def bench_rba_solve(counter):
+    """One default RbaModel.solve, the reference for the solve scenario."""
+    from model_cache import load_model
+    model = load_model("model")
+    return {'mu_opt': model.solve(bissection_tol=0.01).mu_opt}
+
+
+def bench_sweep(counter):
+    """acetate_fullox_tradeoff.py: the adaptive scan, result store included."""
+    import shutil
+    import tempfile
+    from adaptive_scan import adaptive_scan
+    from model_cache import load_model
+    from efficiency_index import EfficiencyIndex
+    from reaction_sets import tca_resp_reactions
+    efficiency_functions = EfficiencyIndex(load_model("model")).function_ids(tca_resp_reactions)
+    store = tempfile.mkdtemp()
+    try:
+        table = adaptive_scan(lambda efficiency: dict.fromkeys(efficiency_functions, efficiency), 100000, 900000,
+                              fluxes=["R_rxn05488_c", "R_rxn10042_c"], tol=0.05, store=store, overwrite=True,
+                              profile=True, bissection_tol=0.001)
+    finally:
+        shutil.rmtree(store)
+    # the points are solved in worker processes, out of the counter's reach
+    counter.add_profiles(table)
+    return {'points': len(table), 'mu_opt': list(table['mu_opt'])}
+
+
+def bench_knockout(counter):
+    """OAD_tradeoff.py RBA part: wild type and Na-OAD knockout."""
+    from model_cache import load_model
+    from warm_solver import WarmStartSolver
+    from efficiency_index import EfficiencyIndex
+    model = load_model("model")
+    solver = WarmStartSolver(model)
+    wt = solver.solve().mu_opt
+    EfficiencyIndex(model).update_from_file('kapp_NaOAD_KO.tsv')
+    ko = solver.solve(bracket=(0, wt)).mu_opt
+    return {'mu_wt': wt, 'mu_ko': ko}
+
+
+def bench_gsmm(counter):
+    """Load iLC858_v1.1 and run FBA and loopless FBA (OAD_tradeoff.py GSMM part)."""
+    from gsmm_cache import load_gsmm
+    from loopless_fba import LooplessFBA
+    start = time.time()
+    gem = load_gsmm(GEM_PATH)
+    gem.solver = 'glpk'
+    load_time = time.time() - start
+    fba = gem.slim_optimize()
+    loopless = LooplessFBA(gem)
+    gem.reactions.get_by_id("rxn05488_c").bounds = (-1000, -23.3)
+    return {'load_time': load_time, 'fba': fba, 'loopless': loopless.optimize().objective_value}
+
+
+SCENARIOS = collections.OrderedDict([
+    ('load', bench_load),
+    ('load_cached', bench_load_cached),
+    ('solve', bench_solve),
+    ('rba_solve', bench_rba_solve),
+    ('sweep', bench_sweep),
+    ('knockout', bench_knockout),
+    ('gsmm', bench_gsmm),
+])
+
+
+# ru_maxrss is in kB on Linux and in bytes on macOS
+def _peak_rss_mb():
+    scale = 1024 * 1024 if sys.platform == 'darwin' else 1024
+    peak = max(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+               resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss)
+    return peak / scale
+
+
+def run_scenario(name):
+    """Run one scenario in the current process and return its measurements."""
+    with SolveCounter() as counter:
+        start = time.time()
+        values = SCENARIOS[name](counter)
+        wall_time = time.time() - start
+    return {
+        'wall_time': wall_time,
+        'peak_rss_mb': _peak_rss_mb(),
+        'solves': counter.solves,
+        'lp_solves': counter.lp_solves,
+        'bisection_iterations': counter.bisection_iterations,
+        'values': values,
+    }
+
+
+def _git_commit():
+    try:
+        return subprocess.check_output(['git', 'rev-parse', 'HEAD'], stderr=subprocess.DEVNULL).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run_benchmarks(names=None):
+    """Run scenarios, each in its own interpreter; failures are recorded, not raised."""
+    results = collections.OrderedDict()
+    for name in names or SCENARIOS:
+        print('Running', name, '...')
+        try:
+            output = subprocess.check_output([sys.executable, os.path.abspath(__file__), '--scenario', name])
+            results[name] = json.loads(output.decode().strip().splitlines()[-1])
+        except subprocess.CalledProcessError as error:
+            results[name] = {'error': 'exit status {}'.format(error.returncode)}
+    return {
+        'commit': _git_commit(),
+        'timestamp': datetime.datetime.now().isoformat(),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'rba': getattr(rba, '__version__', None),
+        'results': results,
+    }
+
+
+def compare(old, new):
+    """Print the relative change of every shared measurement between two result files."""
+    print('{:<12} {:<22} {:>12} {:>12} {:>8}'.format('scenario', 'metric', 'old', 'new', 'change'))
+    for name, result in new['results'].items():
+        previous = old['results'].get(name)
+        if previous is None or 'error' in previous or 'error' in result:
+            continue
+        for metric in ('wall_time', 'peak_rss_mb', 'lp_solves', 'bisection_iterations'):
+            a, b = previous[metric], result[metric]
+            change = '{:+.1%}'.format((b - a) / a) if a else ''
+            print('{:<12} {:<22} {:>12.4g} {:>12.4g} {:>8}'.format(name, metric, a, b, change))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('scenarios', nargs='*', help='any of: ' + ', '.join(SCENARIOS))
+    parser.add_argument('-o', '--output', default='benchmark.json')
+    parser.add_argument('--scenario', help=argparse.SUPPRESS)
+    parser.add_argument('--compare', nargs=2, metavar=('OLD', 'NEW'))
+    args = parser.parse_args()
+    unknown = set(args.scenarios) - set(SCENARIOS)
+    if unknown:
+        parser.error('unknown scenarios: ' + ', '.join(sorted(unknown)))
+
+    if args.scenario:
+        print(json.dumps(run_scenario(args.scenario)))
+    elif args.compare:
+        with open(args.compare[0]) as old, open(args.compare[1]) as new:
+            compare(json.load(old), json.load(new))
+    else:
+        report = run_benchmarks(args.scenarios)
+        with open(args.output, 'w') as output:
+            json.dump(report, output, indent=2)
+        for name, result in report['results'].items():
+            if 'error' in result:
+                print('{:<12} {}'.format(name, result['error']))
+            else:
+                print('{:<12} {:8.2f} s {:8.1f} MB {:5d} LPs'.format(
+                    name, result['wall_time'], result['peak_rss_mb'], result['lp_solves']))
+
+if __name__ == '__main__':
+    main()
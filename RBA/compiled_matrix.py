@@ -0,0 +1,310 @@
+"""RBA constraint matrix compiled into coefficient arrays over a fixed sparsity pattern."""
+
+from __future__ import absolute_import, division, print_function
+
+import os
+import sys
+sys.path.append("/Users/lucascoppens/Documents/Phd/Active/Vnat modelling/Vnat_v5/RBA/RBApy")
+import rba
+
+# package imports
+import pickle
+import tempfile
+import numpy as np
+import scipy.sparse as sp
+from parameter_arrays import ParameterArrays
+
+# How each coefficient depends on mu:
+#   CONSTANT   c0
+#   AFFINE     c0 + c1 * mu
+#   SCALED     c1 * p(mu)        p = a parameters.xml function or aggregate
+#   SCALED_MU  c1 * mu * p(mu)
+#   SOURCE     not recognised; taken from rba's ConstraintMatrix at every build
+CONSTANT, AFFINE, SCALED, SCALED_MU, SOURCE = range(5)
+
+# Growth rates the source matrix is sampled at when compiling; the last one
+# is held out to check the fitted coefficients. A refresh re-fits at the two
+# REFRESH_MU and checks at the same held-out growth rate.
+SAMPLE_MU = (0.0537, 0.4129, 0.8391, 1.3377, 2.0713, 0.6173)
+REFRESH_MU = (0.4129, 1.3377)
+RTOL = 1e-9
+
+
+# Copy of everything build_matrices sets, so samples can be compared later
+def _snapshot(matrix):
+    return (matrix.A.tocsr().copy(), np.array(matrix.b, dtype=float), np.array(matrix.LB, dtype=float),
+            np.array(matrix.UB, dtype=float), np.array(matrix.f, dtype=float))
+
+
+def _stack(snapshot, rows, cols):
+    """All coefficients of a snapshot as one vector: A on the pattern, b, LB, UB, f."""
+    A = snapshot[0]
+    data = np.asarray(A[rows, cols]).ravel() if len(rows) else np.empty(0)
+    return np.concatenate([data] + list(snapshot[1:]))
+
+
+def _close(actual, expected):
+    scale = np.maximum(np.abs(actual), np.abs(expected))
+    with np.errstate(invalid='ignore'):
+        return (actual == expected) | (np.abs(actual - expected) <= RTOL * scale)
+
+
+# Direction of a vector as a hashable key: unit length, first nonzero positive
+def _direction_keys(vectors):
+    norms = np.linalg.norm(vectors, axis=1)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        unit = vectors / norms[:, None]
+    first = np.argmax(unit != 0, axis=1)
+    unit *= np.sign(unit[np.arange(len(unit)), first])[:, None]
+    unit = np.round(unit, 8) + 0.0
+    return [row.tobytes() for row in unit]
+
+
+class CompiledMatrix(object):
+    """Drop-in for rba's ConstraintMatrix that rebuilds A(mu), b, LB, UB and f from arrays.
+
+    Compiling samples the source matrix at a few growth rates and
+    classifies every coefficient as mu-independent or as an affine or
+    parameter-function-scaled term of mu (see the kind codes above). After
+    that, build_matrices(mu) is a handful of NumPy operations. Coefficients
+    that fit none of these forms are flagged SOURCE and read from the
+    source matrix, so the result is always the same as rba's.
+
+    The compiled form holds model parameter values. After changing
+    parameters or the medium, call refresh(), which re-fits the
+    coefficients from three source builds without re-classifying them.
+    Compiled matrices can be saved and loaded without the model as long as
+    they have no SOURCE entries.
+    """
+
+    def __init__(self, model, source=None):
+        self.model = model
+        self._source = source if source is not None else rba.ConstraintMatrix(model)
+        self.parameters = ParameterArrays(model)
+        self._compile()
+
+    # -- compilation --------------------------------------------------------
+
+    def _sample(self, mu):
+        self._source.build_matrices(mu)
+        return _snapshot(self._source)
+
+    def _compile(self):
+        samples = [self._sample(mu) for mu in SAMPLE_MU]
+        self.row_signs = list(self._source.row_signs)
+        self.row_names = list(self._source.row_names)
+        self.col_names = list(self._source.col_names)
+        self.shape = samples[0][0].shape
+
+        # union sparsity pattern over all samples, in CSR order
+        pattern = sum(abs(sample[0]) for sample in samples).tocsr()
+        pattern.sort_indices()
+        self.indptr, self.indices = pattern.indptr.copy(), pattern.indices.copy()
+        rows = np.repeat(np.arange(self.shape[0]), np.diff(self.indptr))
+        self._rows, self._cols = rows, self.indices
+        n_rows, n_cols = self.shape
+        nnz = len(self.indices)
+        self._segments = {
+            'A': slice(0, nnz),
+            'b': slice(nnz, nnz + n_rows),
+            'LB': slice(nnz + n_rows, nnz + n_rows + n_cols),
+            'UB': slice(nnz + n_rows + n_cols, nnz + n_rows + 2 * n_cols),
+            'f': slice(nnz + n_rows + 2 * n_cols, nnz + n_rows + 3 * n_cols),
+        }
+
+        values = [_stack(sample, rows, self.indices) for sample in samples]
+        Y = np.column_stack(values[:-1])
+        mu = np.array(SAMPLE_MU[:-1])
+        n = Y.shape[0]
+
+        self.kind = np.full(n, SOURCE, dtype=np.int8)
+        self.c0 = np.zeros(n)
+        self.c1 = np.zeros(n)
+        self.basis = np.zeros(n, dtype=np.intp)
+
+        constant = np.all(Y == Y[:, :1], axis=1)
+        self.kind[constant] = CONSTANT
+        self.c0[constant] = Y[constant, 0]
+
+        # affine in mu: least squares on [1, mu], kept if the fit is exact
+        todo = np.flatnonzero(~constant & np.all(np.isfinite(Y), axis=1))
+        M = np.column_stack([np.ones_like(mu), mu])
+        coef = np.linalg.lstsq(M, Y[todo].T, rcond=None)[0]
+        affine = np.all(_close(M.dot(coef).T, Y[todo]), axis=1)
+        self.kind[todo[affine]] = AFFINE
+        self.c0[todo[affine]], self.c1[todo[affine]] = coef[0, affine], coef[1, affine]
+
+        # c * p(mu) or c * mu * p(mu) for a growth-rate dependent function p
+        todo = todo[~affine]
+        if len(todo):
+            P = self.parameters.evaluate(mu)
+            Q = np.vstack([P, P * mu[None, :]])
+            usable = np.all(np.isfinite(Q), axis=1) & ~np.all(Q == Q[:, :1], axis=1)
+            lookup = {}
+            for j, key in zip(np.flatnonzero(usable), _direction_keys(Q[usable])):
+                lookup.setdefault(key, j)
+            for i, key in zip(todo, _direction_keys(Y[todo])):
+                j = lookup.get(key)
+                if j is None:
+                    continue
+                q, y = Q[j], Y[i]
+                c = q.dot(y) / q.dot(q)
+                if np.all(_close(c * q, y)):
+                    n_basis = len(P)
+                    self.kind[i] = SCALED if j < n_basis else SCALED_MU
+                    self.basis[i] = j % n_basis
+                    self.c1[i] = c
+
+        # check everything against the held-out sample
+        predicted = self._evaluate(SAMPLE_MU[-1], source_values=values[-1])
+        self.kind[~_close(predicted, values[-1])] = SOURCE
+
+    # -- evaluation ----------------------------------------------------------
+
+    def _evaluate(self, mu, source_values=None):
+        P = self.parameters.evaluate(mu)
+        kind = self.kind
+        v = self.c0.copy()
+        affine = kind == AFFINE
+        v[affine] += self.c1[affine] * mu
+        scaled = kind == SCALED
+        v[scaled] = self.c1[scaled] * P[self.basis[scaled]]
+        scaled_mu = kind == SCALED_MU
+        v[scaled_mu] = self.c1[scaled_mu] * mu * P[self.basis[scaled_mu]]
+        source = kind == SOURCE
+        if source.any():
+            if source_values is None:
+                if self._source is None:
+                    raise ValueError('Compiled matrix has SOURCE entries but no source matrix')
+                source_values = _stack(self._sample(mu), self._rows, self._cols)
+            v[source] = source_values[source]
+        return v
+
+    def build_matrices(self, mu):
+        """Set A, b, LB, UB and f for growth rate mu, like ConstraintMatrix.build_matrices."""
+        v = self._evaluate(mu)
+        segments = self._segments
+        self.A = sp.csr_matrix((v[segments['A']], self.indices, self.indptr), shape=self.shape)
+        self.b = v[segments['b']]
+        self.LB = v[segments['LB']]
+        self.UB = v[segments['UB']]
+        self.f = v[segments['f']]
+
+    # -- structure -------------------------------------------------------------
+
+    @property
+    def n_source(self):
+        return int(np.count_nonzero(self.kind == SOURCE))
+
+    @property
+    def dynamic(self):
+        """Mask over the coefficient vector of the entries that depend on mu."""
+        return self.kind != CONSTANT
+
+    @property
+    def A_static(self):
+        """The mu-independent part of A."""
+        data = np.where(self.kind[self._segments['A']] == CONSTANT, self.c0[self._segments['A']], 0.0)
+        A = sp.csr_matrix((data, self.indices, self.indptr), shape=self.shape)
+        A.eliminate_zeros()
+        return A
+
+    @property
+    def dynamic_entries(self):
+        """(row, col) of the mu-dependent coefficients of A."""
+        mask = self.dynamic[self._segments['A']]
+        return self._rows[mask], self._cols[mask]
+
+    # -- parameter changes -------------------------------------------------------
+
+    def set_medium(self, medium):
+        """Switch to another medium (a metabolite -> concentration dict)."""
+        self.refresh(medium)
+
+    def _on_pattern(self, A):
+        """Whether A has the compiled shape and all its nonzeros lie on the compiled pattern."""
+        if A.shape != self.shape:
+            return False
+        A = A.tocoo()
+        nonzero = A.data != 0
+        n_cols = self.shape[1]
+        keys = A.row[nonzero].astype(np.int64) * n_cols + A.col[nonzero]
+        # row-major keys of the pattern; sorted since the pattern is in CSR order
+        pattern = self._rows.astype(np.int64) * n_cols + self._cols
+        if not len(pattern):
+            return not len(keys)
+        found = np.minimum(np.searchsorted(pattern, keys), len(pattern) - 1)
+        return bool(np.all(pattern[found] == keys))
+
+    def refresh(self, medium=None):
+        """Re-fit the coefficients after model parameters or the medium changed.
+
+        Without medium, the source matrix is rebuilt from the model (which
+        picks up parameter changes); with medium, only the medium of the
+        current source matrix is changed. Costs three source builds: two
+        to re-fit and a held-out one to check the fit. Falls back to a
+        full compile if the rows or columns changed, a nonzero appeared
+        outside the compiled sparsity pattern, or a coefficient no longer
+        fits its kind at the held-out growth rate.
+        """
+        if medium is None:
+            self._source = rba.ConstraintMatrix(self.model)
+            self.parameters = ParameterArrays(self.model)
+        else:
+            self._source.set_medium(medium)
+            self.parameters.set_medium(medium)
+
+        mu_a, mu_b = REFRESH_MU
+        sample = self._sample(mu_a)
+        if (list(self._source.row_names) != self.row_names or list(self._source.col_names) != self.col_names
+                or not self._on_pattern(sample[0])):
+            self._compile()
+            return
+        y_a = _stack(sample, self._rows, self._cols)
+        y_b = _stack(self._sample(mu_b), self._rows, self._cols)
+
+        kind = self.kind
+        P_a, P_b = self.parameters.evaluate(mu_a), self.parameters.evaluate(mu_b)
+        constant = kind == CONSTANT
+        self.c0[constant] = y_a[constant]
+        affine = kind == AFFINE
+        self.c1[affine] = (y_b[affine] - y_a[affine]) / (mu_b - mu_a)
+        self.c0[affine] = y_a[affine] - self.c1[affine] * mu_a
+        for code, factor_a, factor_b in ((SCALED, 1.0, 1.0), (SCALED_MU, mu_a, mu_b)):
+            idx = np.flatnonzero(kind == code)
+            q_a = factor_a * P_a[self.basis[idx]]
+            q_b = factor_b * P_b[self.basis[idx]]
+            with np.errstate(divide='ignore', invalid='ignore'):
+                self.c1[idx] = np.where(q_a != 0, y_a[idx] / q_a, y_b[idx] / q_b)
+
+        mu_check = SAMPLE_MU[-1]
+        y_check = _stack(self._sample(mu_check), self._rows, self._cols)
+        if not np.all(_close(self._evaluate(mu_check, source_values=y_check), y_check)):
+            self._compile()
+
+    # -- serialization -----------------------------------------------------------
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state['model'] = None
+        state['_source'] = None
+        for name in ('A', 'b', 'LB', 'UB', 'f'):
+            state.pop(name, None)
+        return state
+
+    def save(self, path):
+        """Write the compiled matrix (without the model) to path."""
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(os.path.abspath(path)))
+        with os.fdopen(fd, 'wb') as f:
+            pickle.dump(self, f, pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path, model=None):
+        """Read a compiled matrix; pass the model to allow refresh() and SOURCE entries."""
+        with open(path, 'rb') as f:
+            compiled = pickle.load(f)
+        if model is not None:
+            compiled.model = model
+            compiled._source = rba.ConstraintMatrix(model)
+        return compiled
@@ -0,0 +1,372 @@
+"""Index enzyme efficiencies by reaction and update them in bulk."""
+
+from __future__ import absolute_import, division, print_function
+
+import os
+import sys
+sys.path.append("/Users/lucascoppens/Documents/Phd/Active/Vnat modelling/Vnat_v5/RBA/RBApy")
+import rba
+
+# package imports
+import warnings
+import numpy as np
+import pandas as pd
+
+SENSES = ('forward', 'backward')
+DEFAULTS = ('default_efficiency', 'default_transporter_efficiency')
+
+
+# R_rxn00256_c_duplicate_2 -> rxn00256_c, the id used in the scripts and the GSMM
+def base_reaction(reaction_id):
+    if reaction_id.startswith('R_'):
+        reaction_id = reaction_id[2:]
+    return reaction_id.split('_duplicate_')[0]
+
+
+def _constant(fn):
+    if fn is None or fn.type != 'constant':
+        return None
+    return fn.parameters.get_by_id('CONSTANT')
+
+
+def read_efficiency_file(file_name):
+    """Read a set_enzyme_efficiencies file into (defaults, table, functions).
+
+    The file has the four line formats rba accepts (tab separated):
+        default_efficiency <value>  /  default_transporter_efficiency <value>
+        <enzyme_id> <forward> <backward>
+        <enzyme_id> <forward|backward> <fn_type> [<param_name> <param_value>]...
+    defaults maps the default ids to their value, table holds the constant
+    lines (indexed by enzyme, forward and backward columns) and functions
+    the last kind as (enzyme_id, sense, fn_type, {param: value}) tuples.
+    Any other line raises UserWarning, like rba.
+    """
+    defaults, rows, functions = {}, [], []
+    with open(file_name, 'r') as input_stream:
+        for line in input_stream:
+            tokens = line.strip().split('\t')
+            if tokens == ['']:
+                continue
+            if len(tokens) == 2 and tokens[0] in DEFAULTS:
+                defaults[tokens[0]] = float(tokens[1])
+            elif len(tokens) == 3:
+                rows.append((tokens[0], float(tokens[1]), float(tokens[2])))
+            elif len(tokens) > 3 and tokens[1] in SENSES and len(tokens) % 2 == 1:
+                parameters = dict(zip(tokens[3::2], [float(value) for value in tokens[4::2]]))
+                functions.append((tokens[0], tokens[1], tokens[2], parameters))
+            else:
+                raise UserWarning('Invalid line: ' + line)
+    table = pd.DataFrame(rows, columns=['enzyme', 'forward', 'backward']).set_index('enzyme')
+    return defaults, table, functions
+
+
+class EfficiencyIndex(object):
+    """Reaction/enzyme id -> efficiency parameter index for one model.
+
+    Built once per model. Setting an efficiency follows rba's
+    set_enzyme_efficiencies: an enzyme that still points at a default
+    efficiency (default_efficiency, or default_transporter_efficiency
+    inside a transporter aggregate) gets its own constant function
+    <enzyme_id>_<sense>_efficiency; any other efficiency function is
+    updated in place, so enzymes sharing it change together. restore()
+    undoes both again. Current values are kept in the forward/backward
+    arrays so unchanged entries are never written; call refresh() after
+    editing efficiency functions behind its back.
+
+    Like set_enzyme_efficiencies, ids that match no enzyme are skipped, with
+    a warning, unless strict is set.
+    """
+
+    def __init__(self, model, strict=False):
+        self.model = model
+        self.strict = strict
+        self._functions = model.parameters.functions
+        self._aggregates = model.parameters.aggregates
+        enzymes = list(model.enzymes.enzymes)
+
+        self.enzyme_ids = [enz.id for enz in enzymes]
+        self._enzymes = enzymes
+        self._row = {enz.id: i for i, enz in enumerate(enzymes)}
+        self._by_reaction = {}
+        for i, enz in enumerate(enzymes):
+            self._by_reaction.setdefault(enz.reaction, []).append(i)
+            if base_reaction(enz.reaction) != enz.reaction:
+                self._by_reaction.setdefault(base_reaction(enz.reaction), []).append(i)
+
+        n = len(enzymes)
+        # (sense index, row) -> what a materialized efficiency pointed at before
+        self._shared = {}
+        # function id -> (function, type, parameters) before it was replaced in place
+        self._replaced = {}
+        self._parameters = np.empty((2, n), dtype=object)
+        self.values = np.full((2, n), np.nan)
+        self._reindex()
+
+    @property
+    def forward(self):
+        return self.values[0]
+
+    @property
+    def backward(self):
+        return self.values[1]
+
+    def _function_id(self, enzyme, sense):
+        return '{}_{}_efficiency'.format(enzyme.id, sense)
+
+    # The function a new efficiency goes into, picked like rba does: the
+    # efficiency function itself, or in a transporter aggregate the reference
+    # to the enzyme's own function or to a default. Returns (function, ref).
+    def _efficiency_function(self, enzyme, sense):
+        current = getattr(enzyme, sense + '_efficiency')
+        fn = self._functions.get_by_id(current)
+        if fn is not None:
+            return fn, None
+        agg = self._aggregates.get_by_id(current)
+        if agg is not None:
+            own = self._function_id(enzyme, sense)
+            for ref in agg.function_references:
+                if ref.function == own or ref.function in DEFAULTS:
+                    return self._functions.get_by_id(ref.function), ref
+        return None, None
+
+    # CONSTANT parameter a new value is written to, or None when a write first
+    # needs a new function (a default efficiency) or a new type (not constant)
+    def _target(self, enzyme, sense):
+        fn, _ = self._efficiency_function(enzyme, sense)
+        if fn is None or fn.id in DEFAULTS:
+            return None
+        return _constant(fn)
+
+    # Rebuild the row -> parameter index after functions were added or replaced
+    def _reindex(self):
+        self._users = {}
+        for i, enz in enumerate(self._enzymes):
+            for s, sense in enumerate(SENSES):
+                parameter = self._target(enz, sense)
+                self._parameters[s, i] = parameter
+                if parameter is not None:
+                    self._users.setdefault(id(parameter), []).append((s, i))
+        self.refresh()
+
+    # Give an enzyme its own constant efficiency function, starting from the default value
+    def _materialize(self, row, s, fn, ref):
+        enzyme = self._enzymes[row]
+        fn_id = self._function_id(enzyme, SENSES[s])
+        default = _constant(fn)
+        if default is None:
+            raise ValueError('{} is not a constant efficiency'.format(fn.id))
+        self._functions.append(rba.xml.Function(fn_id, 'constant', {'CONSTANT': default.value}))
+        if ref is None:
+            self._shared[s, row] = (getattr(enzyme, SENSES[s] + '_efficiency'), None)
+            setattr(enzyme, SENSES[s] + '_efficiency', fn_id)
+        else:
+            self._shared[s, row] = (ref.function, ref)
+            ref.function = fn_id
+        parameter = self._functions.get_by_id(fn_id).parameters.get_by_id('CONSTANT')
+        self._parameters[s, row] = parameter
+        self._users[id(parameter)] = [(s, row)]
+        return parameter
+
+    # Point a materialized efficiency back at the default and drop its function
+    def _unmaterialize(self, s, row):
+        enzyme = self._enzymes[row]
+        fn_id = self._function_id(enzyme, SENSES[s])
+        shared_id, ref = self._shared.pop((s, row))
+        if ref is None:
+            setattr(enzyme, SENSES[s] + '_efficiency', shared_id)
+        else:
+            ref.function = shared_id
+        self._functions.remove(self._functions.get_by_id(fn_id))
+        self._users.pop(id(self._parameters[s, row]), None)
+        self._parameters[s, row] = None
+        self.values[s, row] = self._value(s, row)
+
+    # Give an existing efficiency function a new type and parameters, keeping its id
+    def _replace(self, fn, fn_type, parameters):
+        if fn.id not in self._replaced:
+            self._replaced[fn.id] = (fn, fn.type, {p.id: p.value for p in fn.parameters})
+        fn.type = fn_type
+        fn.set_parameters(parameters)
+
+    # Parameter to write a new constant value of an efficiency to, created if needed
+    def _prepare(self, row, s):
+        enzyme = self._enzymes[row]
+        fn, ref = self._efficiency_function(enzyme, SENSES[s])
+        if fn is None:
+            raise ValueError('{} efficiency of {} has no function that can be updated'
+                             .format(SENSES[s], enzyme.id))
+        if fn.id in DEFAULTS:
+            return self._materialize(row, s, fn, ref)
+        self._replace(fn, 'constant', {'CONSTANT': np.nan})
+        self._reindex()
+        return self._parameters[s, row]
+
+    def _value(self, s, row):
+        parameter = self._parameters[s, row]
+        if parameter is None:
+            parameter = _constant(self._efficiency_function(self._enzymes[row], SENSES[s])[0])
+        return np.nan if parameter is None else float(parameter.value)
+
+    def refresh(self):
+        """Re-read all values from the model, e.g. after default_efficiency changed."""
+        for i in range(len(self._enzymes)):
+            for s in range(len(SENSES)):
+                self.values[s, i] = self._value(s, i)
+
+    def _lookup(self, id_):
+        if id_ in self._row:
+            return [self._row[id_]]
+        if id_ in self._by_reaction:
+            return self._by_reaction[id_]
+        if self.strict:
+            raise KeyError('no enzyme for {}'.format(id_))
+        warnings.warn('no enzyme for {}, skipped'.format(id_))
+        return []
+
+    def rows(self, ids):
+        """Enzyme rows for a list of enzyme ids, reaction ids or base reaction ids."""
+        rows = []
+        for id_ in ids:
+            rows.extend(self._lookup(id_))
+        return np.array(rows, dtype=np.intp)
+
+    def function_ids(self, ids, senses=SENSES):
+        """Ids of the efficiency functions that hold the given enzymes'/reactions' values.
+
+        That is the enzyme's own <enzyme_id>_<sense>_efficiency where it
+        points at a default, and the function it already uses otherwise.
+        Own functions are not created here: sweep workers, which load their
+        own copy of the model, create them with materialize() when an
+        assignment first sets them.
+        """
+        function_ids = []
+        for row in self.rows(ids):
+            enzyme = self._enzymes[row]
+            for sense in senses:
+                fn, _ = self._efficiency_function(enzyme, sense)
+                own = fn is None or fn.id in DEFAULTS
+                function_ids.append(self._function_id(enzyme, sense) if own else fn.id)
+        return function_ids
+
+    def materialize(self, function_ids):
+        """Create the enzymes' own efficiency functions among function_ids that do not exist yet."""
+        for fn_id in function_ids:
+            for s, sense in enumerate(SENSES):
+                suffix = '_{}_efficiency'.format(sense)
+                if fn_id.endswith(suffix) and fn_id[:-len(suffix)] in self._row:
+                    row = self._row[fn_id[:-len(suffix)]]
+                    if self._parameters[s, row] is None:
+                        self._prepare(row, s)
+                    break
+            else:
+                raise KeyError('{} is not an enzyme efficiency function'.format(fn_id))
+
+    def set(self, ids, forward, backward=None):
+        """Set efficiencies for enzymes matched by ids (see rows()).
+
+        forward and backward are scalars or arrays with one value per id;
+        backward defaults to forward. Every enzyme of a reaction id gets that
+        id's value. NaN values raise a ValueError.
+        """
+        matches = [self._lookup(id_) for id_ in ids]
+        counts = [len(rows) for rows in matches]
+        rows = np.array([row for rows in matches for row in rows], dtype=np.intp)
+        forward = np.repeat(np.broadcast_to(np.asarray(forward, dtype=float), len(counts)), counts)
+        backward = forward if backward is None else \
+            np.repeat(np.broadcast_to(np.asarray(backward, dtype=float), len(counts)), counts)
+        values = np.vstack([forward, backward])
+        if np.isnan(values).any():
+            raise ValueError('cannot set NaN efficiencies')
+        self._write(rows, values)
+
+    def set_function(self, ids, sense, fn_type, parameters):
+        """Make the sense efficiency of the matched enzymes an arbitrary rba function.
+
+        Same placement as set(): a new <enzyme_id>_<sense>_efficiency for
+        enzymes on a default efficiency, otherwise the current function is
+        replaced in place.
+        """
+        s = SENSES.index(sense)
+        for row in self.rows(ids):
+            enzyme = self._enzymes[row]
+            fn, ref = self._efficiency_function(enzyme, sense)
+            if fn is None:
+                raise ValueError('{} efficiency of {} has no function that can be updated'.format(sense, enzyme.id))
+            if fn.id in DEFAULTS:
+                self._materialize(row, s, fn, ref)
+                fn = self._functions.get_by_id(self._function_id(enzyme, sense))
+            self._replace(fn, fn_type, parameters)
+        self._reindex()
+
+    def update(self, table):
+        """Apply a DataFrame indexed by enzyme/reaction id with forward and backward columns."""
+        self.set(list(table.index), table['forward'].values, table['backward'].values)
+
+    def update_from_file(self, file_name):
+        """Apply an RbaModel.set_enzyme_efficiencies file (see read_efficiency_file).
+
+        Efficiencies end up in the same functions as with rba. Unlike rba,
+        ids may also be reaction ids, and ids that match no enzyme are
+        reported (see strict) instead of being ignored.
+        """
+        defaults, table, functions = read_efficiency_file(file_name)
+        for fn_id, value in defaults.items():
+            self._functions.get_by_id(fn_id).parameters.get_by_id('CONSTANT').value = value
+        if defaults:
+            self.refresh()
+        self.update(table)
+        for id_, sense, fn_type, parameters in functions:
+            self.set_function([id_], sense, fn_type, parameters)
+
+    # NaN in values means "unknown, leave as is" (restore() of a function
+    # that was not constant); set() refuses NaN before it gets here
+    def _write(self, rows, values):
+        for s in range(len(SENSES)):
+            mask = (values[s] != self.values[s, rows]) & ~np.isnan(values[s])
+            for row, value in zip(rows[mask], values[s][mask]):
+                parameter = self._parameters[s, row]
+                if parameter is None:
+                    parameter = self._prepare(row, s)
+                parameter.value = value
+                # every enzyme that shares the function now has this value
+                for s_user, row_user in self._users[id(parameter)]:
+                    self.values[s_user, row_user] = value
+
+    # CONSTANT parameters of the default efficiencies
+    def _defaults(self):
+        return {fn_id: _constant(self._functions.get_by_id(fn_id)) for fn_id in DEFAULTS
+                if _constant(self._functions.get_by_id(fn_id)) is not None}
+
+    def snapshot(self):
+        """Current efficiency values, defaults, materialized and replaced functions, for restore()."""
+        defaults = {fn_id: parameter.value for fn_id, parameter in self._defaults().items()}
+        return self.values.copy(), defaults, frozenset(self._shared), frozenset(self._replaced)
+
+    def restore(self, snapshot):
+        """Put back the state of snapshot(), writing only values that changed.
+
+        The default efficiencies get their old values, efficiencies
+        materialized since the snapshot point at their default function
+        again, so they follow e.g. default_efficiency as before, and
+        functions replaced since then get their old type back.
+        """
+        values, defaults, shared, replaced = snapshot
+        values = values.copy()
+        changed_defaults = False
+        for fn_id, parameter in self._defaults().items():
+            if fn_id in defaults and parameter.value != defaults[fn_id]:
+                parameter.value = defaults[fn_id]
+                changed_defaults = True
+        if changed_defaults:
+            self.refresh()
+        for s, row in sorted(set(self._shared) - shared):
+            self._unmaterialize(s, row)
+            values[s, row] = self.values[s, row]
+        if set(self._replaced) - replaced:
+            for fn_id in set(self._replaced) - replaced:
+                fn, fn_type, parameters = self._replaced.pop(fn_id)
+                fn.type = fn_type
+                fn.set_parameters(parameters)
+            self._reindex()
+        rows = np.flatnonzero(np.any((values != self.values) & ~np.isnan(values), axis=0))
+        self._write(rows, values[:, rows])
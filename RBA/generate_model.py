@@ -3,36 +3,57 @@ from __future__ import absolute_import, division, print_function
 import os
 import sys
 sys.path.append("/Users/lucascoppens/Documents/Phd/Active/Vnat modelling/Vnat_v5/RBA/RBApy")
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "GSMM"))
 import rba
 
 # package imports
+import logging
 import re
-import cobra
+from efficiency_index import EfficiencyIndex
+from gsmm_cache import export_sbml
+from pipeline import Stage, Pipeline, write_changed
+from protein_table import read_protein_table, model_from_data
 
 def main():
+    logging.basicConfig(level=logging.INFO, format='%(message)s')
     import_gem()
 
-    # Inital run of model generation creates helper files
-    vnat_rba = rba.RbaModel.from_data('params.in')
+    # Each stage only re-runs when its input files, its code (including the
+    # helper modules it depends on), the rba version or an earlier stage
+    # changed; e.g. editing kapp_resp.tsv resumes from the cached from_data model.
+    stages = [
+        Stage('build', build_model, inputs=['params.in', 'data'],
+              exclude=['data/medium.tsv', 'data/kapp_resp.tsv'], depends=['protein_table'],
+              version=getattr(rba, '__version__', None)),
+        Stage('medium', set_medium, inputs=['data/medium.tsv'], cache=False),
+        Stage('processes', update_processes, cache=False),
+        Stage('efficiencies', set_efficiencies, inputs=['data/kapp_resp.tsv'], cache=False,
+              depends=['efficiency_index']),
+        Stage('maintenance', set_maintenance_reaction, cache=False),
+        Stage('protein_params', set_protein_params),
+    ]
+    vnat_rba = Pipeline(stages).run()
 
-    # Set a growth medium
-    vnat_rba.set_medium('data/medium.tsv')
+    written = write_changed(vnat_rba, vnat_rba.output_dir)
+    print('Updated files:', ', '.join(written) if written else 'none')
 
-    update_processes(vnat_rba)
+# Inital run of model generation creates helper files; later runs take the
+# protein compositions from the (cached) protein summary of the previous run
+def build_model(model):
+    if not os.path.isfile('data/protein_summary.tsv'):
+        return rba.RbaModel.from_data('params.in')
+    return model_from_data('params.in', read_protein_table())
 
-    set_efficiencies(vnat_rba)
+# Set a growth medium
+def set_medium(model):
+    model.set_medium('data/medium.tsv')
+    return model
 
-    set_maintenance_reaction(vnat_rba)
-
-    set_protein_params(vnat_rba)
-
-    vnat_rba.write()
-    
 # This GEM modification ensures protons and sodiums are not perceived as medium components
 # Otherwise it would complicate the way RBA handles exchange reactions
+# (skipped when data/sbml.sbml is already an export of the current GEM)
 def import_gem():
-    gem = cobra.io.read_sbml_model('/Users/lucascoppens/Documents/Phd/Active/Vnat modelling/Vnat_v5/github_repo/GSMM/iLC858_v1.1.sbml')
-    cobra.io.write_sbml_model(gem, 'data/sbml.sbml')
+    export_sbml('/Users/lucascoppens/Documents/Phd/Active/Vnat modelling/Vnat_v5/github_repo/GSMM/iLC858_v1.1.sbml', 'data/sbml.sbml')
 
 # customize some process parameters
 def update_processes(model):
@@ -44,6 +65,7 @@ def update_processes(model):
     for pr in ['test_process_0', 'test_process_1', 'test_process_2']:
         pr = model.processes.processes.get_by_id(pr)
         model.processes.processes.remove(pr)
+    return model
 
 # set k_app default efficiencies analogous to E.coli
 def set_efficiencies(model):
@@ -52,7 +74,8 @@ def set_efficiencies(model):
     fn.parameters.get_by_id('CONSTANT').value = 45000
     
     # set kapp respiratory efficiencies
-    model.set_enzyme_efficiencies('data/kapp_resp.tsv')
+    EfficiencyIndex(model).update_from_file('data/kapp_resp.tsv')
+    return model
 
 # implement correct ATP maintenance reaction
 def set_maintenance_reaction(model):
@@ -61,6 +84,7 @@ def set_maintenance_reaction(model):
     model.metabolism.reactions.get_by_id('R_maintenance_atp').products.append(rba.xml.SpeciesReference('M_cpd00008_c', 1))
     model.metabolism.reactions.get_by_id('R_maintenance_atp').products.append(rba.xml.SpeciesReference('M_cpd00009_c', 1))
     model.metabolism.reactions.get_by_id('R_maintenance_atp').products.append(rba.xml.SpeciesReference('M_cpd00067_c', 1))
+    return model
 
 # set protein constraints
 def set_protein_params(model):
@@ -76,6 +100,7 @@ def set_protein_params(model):
     # set amount of secreted protein to 0
     fn = model.parameters.functions.get_by_id('fraction_protein_Secreted')
     fn.parameters.get_by_id('CONSTANT').value = 0
+    return model
 
 if __name__ == "__main__":
     main()
@@ -0,0 +1,147 @@
+"""Cartesian parameter scans that survive crashes and resume where they stopped."""
+
+from __future__ import absolute_import, division, print_function
+
+import os
+import sys
+sys.path.append("/Users/lucascoppens/Documents/Phd/Active/Vnat modelling/Vnat_v5/RBA/RBApy")
+import rba
+
+# package imports
+import csv
+import json
+import itertools
+import logging
+import pandas as pd
+from sweep import iter_sweep
+from model_cache import load_model
+from efficiency_index import EfficiencyIndex
+from reaction_sets import tca_resp_reactions
+
+logger = logging.getLogger(__name__)
+
+# Points a worker takes at once. Small enough that results reach the file
+# regularly, large enough that neighbouring points share a warm solver.
+CHUNK_SIZE = 8
+
+
+def grid_points(axes):
+    """All points of the grid, last axis varying fastest.
+
+    axes is a list of (name, keys, values): keys is one sweep key (a
+    function id, or a (function id, parameter id) tuple) or a list of keys
+    that are all set to the axis value. Returns a list of (values, assignment).
+    """
+    points = []
+    for values in itertools.product(*[axis_values for _, _, axis_values in axes]):
+        assignment = {}
+        for (_, keys, _), value in zip(axes, values):
+            for key in (keys if isinstance(keys, list) else [keys]):
+                assignment[key] = value
+        points.append((values, assignment))
+    return points
+
+
+# Drop a last line that a crash cut short, so new rows start on a fresh line
+def _truncate_partial_line(output_file):
+    with open(output_file, 'rb+') as f:
+        data = f.read()
+        if data and not data.endswith(b'\n'):
+            f.truncate(data.rfind(b'\n') + 1)
+
+
+# The axes as stored next to output_file (keys and values as JSON sees them)
+def _axes_spec(axes):
+    spec = [{'name': name, 'keys': keys, 'values': list(values)} for name, keys, values in axes]
+    return json.loads(json.dumps(spec, default=lambda value: value.item()))
+
+
+def _axes_file(output_file):
+    return output_file + '.axes.json'
+
+
+# Indices of the points already in output_file. Rows are matched by point
+# index, so resuming is refused unless the axes match the ones saved with them.
+def _completed(output_file, header, axes):
+    if not os.path.isfile(output_file) or os.path.getsize(output_file) == 0:
+        return set()
+    _truncate_partial_line(output_file)
+    done = set()
+    with open(output_file, 'r') as input_stream:
+        reader = csv.reader(input_stream)
+        first = next(reader, None)
+        if first is None:
+            return done
+        if first != header:
+            raise ValueError('{} was written by a different scan'.format(output_file))
+        saved = None
+        if os.path.isfile(_axes_file(output_file)):
+            with open(_axes_file(output_file)) as f:
+                saved = json.load(f)
+        if saved != _axes_spec(axes):
+            raise ValueError('{} was written by a scan over different axis values (see {})'
+                             .format(output_file, _axes_file(output_file)))
+        for line in reader:
+            if len(line) == len(header):
+                done.add(int(line[0]))
+    return done
+
+
+def run_grid_scan(axes, output_file, fluxes=(), model_dir="model", processes=None, warm_start=True,
+                  **solve_kwargs):
+    """Solve every point of the Cartesian product of axes, checkpointing to output_file.
+
+    Each finished point is appended to the CSV output_file (point, one
+    column per axis, mu_opt, fluxes) and synced to disk, so a crashed or
+    interrupted scan loses at most the points in flight. Running the same
+    scan again skips the points already in the file; the axes are saved
+    next to it (output_file + '.axes.json') and a scan over different axis
+    values refuses to resume from it. The number of points left is logged
+    at INFO level. Extra keyword
+    arguments go to the solver (see sweep.run_sweep). Returns the complete
+    results as a DataFrame ordered by point.
+    """
+    fluxes = list(fluxes)
+    header = ['point'] + [name for name, _, _ in axes] + ['mu_opt'] + fluxes
+    points = grid_points(axes)
+    done = _completed(output_file, header, axes)
+    todo = [i for i in range(len(points)) if i not in done]
+    logger.info('%d of %d points done, %d to go', len(done), len(points), len(todo))
+
+    if todo:
+        new_file = not os.path.isfile(output_file) or os.path.getsize(output_file) == 0
+        with open(output_file, 'a') as output:
+            writer = csv.writer(output)
+            if new_file:
+                with open(_axes_file(output_file), 'w') as f:
+                    json.dump(_axes_spec(axes), f)
+                writer.writerow(header)
+            rows = iter_sweep([points[i][1] for i in todo], fluxes, model_dir, processes, warm_start,
+                              chunksize=CHUNK_SIZE, **solve_kwargs)
+            for index, row in rows:
+                point = todo[index]
+                writer.writerow([point] + list(points[point][0]) + [row.get(column, float('nan'))
+                                                                   for column in ['mu_opt'] + fluxes])
+                output.flush()
+                os.fsync(output.fileno())
+
+    table = pd.read_csv(output_file)
+    return table.drop_duplicates('point').sort_values('point').reset_index(drop=True)
+
+
+def main():
+    logging.basicConfig(level=logging.INFO, format='%(message)s')
+    # respiratory kapp x default_efficiency x amino_acid_concentration, around
+    # the values set in generate_model.py
+    model = load_model("model")
+    axes = [
+        ('respiratory_kapp', EfficiencyIndex(model).function_ids(tca_resp_reactions),
+         [100000, 300000, 500000, 700000, 900000]),
+        ('default_efficiency', 'default_efficiency', [30000, 45000, 60000]),
+        ('amino_acid_concentration', ('amino_acid_concentration', 'LINEAR_CONSTANT'), [3.5, 4.2727, 5.0]),
+    ]
+    table = run_grid_scan(axes, "grid_scan.csv", fluxes=["R_rxn05488_c", "R_rxn10042_c"], bissection_tol=0.001)
+    print(table)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,145 @@
+"""Growth sensitivity to every enzyme efficiency from the duals of one solve."""
+
+from __future__ import absolute_import, division, print_function
+
+import os
+import sys
+sys.path.append("/Users/lucascoppens/Documents/Phd/Active/Vnat modelling/Vnat_v5/RBA/RBApy")
+import rba
+
+# package imports
+import collections
+import numpy as np
+import pandas as pd
+import scipy.sparse as sp
+from model_cache import load_model
+from warm_solver import WarmStartSolver, LinearProblem, InfeasibleError
+from efficiency_index import EfficiencyIndex
+
+# Just enough of a ConstraintMatrix for LinearProblem
+_Problem = collections.namedtuple('_Problem', ['A', 'b', 'row_signs', 'LB', 'UB', 'f'])
+
+
+def growth_multipliers(matrix, X, mu_opt, step=1e-4):
+    """Row multipliers y of the growth-rate optimum: d(mu_opt) = y . d(A) X for a change d(A).
+
+    mu_opt is the largest mu for which A(mu) x <= b(mu) (per row sign) is
+    feasible. Linearising in mu around (mu_opt, X) gives the LP
+        max delta  s.t.  A x + delta (A' X - b') <= b,
+    whose duals are those multipliers. matrix must be built at mu_opt; it
+    is rebuilt there after sampling A' and b' by central differences.
+    """
+    h = step * max(mu_opt, 1.0)
+    matrix.build_matrices(mu_opt + h)
+    A_up, b_up = matrix.A.tocsr().copy(), np.array(matrix.b, dtype=float)
+    matrix.build_matrices(mu_opt - h)
+    A_down, b_down = matrix.A.tocsr().copy(), np.array(matrix.b, dtype=float)
+    matrix.build_matrices(mu_opt)
+
+    growth_column = ((A_up - A_down).dot(X) - (b_up - b_down)) / (2 * h)
+    n_cols = matrix.A.shape[1]
+    problem = _Problem(
+        A=sp.hstack([matrix.A, sp.csr_matrix(growth_column[:, None])]).tocsr(),
+        b=matrix.b,
+        row_signs=matrix.row_signs,
+        LB=np.append(np.asarray(matrix.LB, dtype=float), -mu_opt),
+        UB=np.append(np.asarray(matrix.UB, dtype=float), mu_opt),
+        f=np.append(np.zeros(n_cols), -1.0))
+    lp = LinearProblem(problem)
+    if not lp.solve():
+        raise ValueError('linearised growth LP is infeasible at mu = {}'.format(mu_opt))
+    delta = lp.X[-1]
+    if abs(delta) >= mu_opt * (1 - 1e-9):
+        raise ValueError('growth is not limited by any linearised constraint at mu = {}'.format(mu_opt))
+    # the duals are d(-delta)/d(b); raising A_ij by e acts like lowering b_i
+    # by e X_j, so d(delta)/d(A_ij) = lambda_i X_j
+    return lp.lambda_
+
+
+def estimate_sensitivity(solver):
+    """d(mu_opt)/d(kapp) of every enzyme from a WarmStartSolver that has just solved.
+
+    An efficiency k only appears in its capacity row, as -k times the
+    enzyme concentration E, so d(mu_opt)/dk = -y_row E with y from
+    growth_multipliers. Returns a DataFrame indexed by enzyme with the
+    columns concentration, forward, backward (efficiencies), dmu_dforward,
+    dmu_dbackward and control: the relative growth change per relative
+    change of both efficiencies, (k_f dmu/dk_f + k_b dmu/dk_b) / mu_opt.
+    """
+    matrix, X, mu_opt = solver.matrix, solver.X, solver.mu_opt
+    y = growth_multipliers(matrix, X, mu_opt)
+    rows = {name: i for i, name in enumerate(matrix.row_names)}
+    cols = {name: j for j, name in enumerate(matrix.col_names)}
+    A = matrix.A.tocsr()
+
+    enzymes = [name[:-len('_forward_capacity')] for name in matrix.row_names
+               if name.endswith('_forward_capacity')]
+    table = pd.DataFrame(index=pd.Index(enzymes, name='enzyme'),
+                         columns=['concentration', 'forward', 'backward', 'dmu_dforward', 'dmu_dbackward'],
+                         dtype=float)
+    j = np.array([cols[e] for e in enzymes])
+    table['concentration'] = X[j]
+    for sense in ('forward', 'backward'):
+        i = np.array([rows['{}_{}_capacity'.format(e, sense)] for e in enzymes])
+        table[sense] = -np.asarray(A[i, j]).ravel()
+        table['dmu_d' + sense] = -y[i] * X[j]
+    table['control'] = (table['forward'] * table['dmu_dforward']
+                        + table['backward'] * table['dmu_dbackward']) / mu_opt
+    return table
+
+
+def kapp_sensitivity(model, n_verify=20, rel_step=0.01, bissection_tol=1e-6):
+    """Rank all enzymes by the growth control of their efficiencies.
+
+    One solve gives estimates for every enzyme (see estimate_sensitivity).
+    The n_verify enzymes with the largest |control| are then re-solved with
+    both efficiencies raised by rel_step, which gives verified_control;
+    it is NaN for the others and for enzymes whose efficiencies are not
+    both constants, which a relative step cannot be applied to. Returns
+    the table sorted by |control|, with the enzyme's reaction added. The
+    model's efficiencies are left as they were.
+    """
+    solver = WarmStartSolver(model, compiled=True)
+    solver.solve(bissection_tol=bissection_tol)
+    mu_opt = solver.mu_opt
+    table = estimate_sensitivity(solver)
+    table.insert(0, 'reaction', pd.Series({enz.id: enz.reaction for enz in model.enzymes.enzymes}))
+    table = table.reindex(table['control'].abs().sort_values(ascending=False).index)
+
+    table['verified_control'] = np.nan
+    index = EfficiencyIndex(model)
+    rows = index.rows(table.index[:n_verify])
+    verify = [(enzyme, row) for enzyme, row in zip(table.index[:n_verify], rows)
+              if np.isfinite(index.forward[row]) and np.isfinite(index.backward[row])]
+    original = index.snapshot()
+    try:
+        # give every enzyme its own efficiency functions up front, so the loop
+        # only writes values and each solve re-fits the compiled matrix
+        # instead of recompiling it for a changed set of functions
+        index.materialize(index.function_ids([enzyme for enzyme, _ in verify]))
+        solver.prepare()
+        materialized = index.snapshot()
+        for enzyme, row in verify:
+            try:
+                index.set([enzyme], index.forward[row] * (1 + rel_step), index.backward[row] * (1 + rel_step))
+                margin = 2 * abs(table.at[enzyme, 'control']) * rel_step * mu_opt + bissection_tol
+                sol = solver.solve(bissection_tol=bissection_tol, bracket=(mu_opt - margin, mu_opt + margin))
+            except InfeasibleError:
+                sol = None
+            finally:
+                index.restore(materialized)
+            if sol is not None:
+                table.at[enzyme, 'verified_control'] = (sol.mu_opt - mu_opt) / mu_opt / rel_step
+    finally:
+        index.restore(original)
+    return table
+
+
+def main():
+    model = load_model("model")
+    table = kapp_sensitivity(model)
+    table.to_csv("kapp_sensitivity.csv")
+    print(table.head(20))
+
+if __name__ == '__main__':
+    main()
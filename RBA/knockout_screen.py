@@ -0,0 +1,105 @@
+"""Single and double enzyme knockout screens for the RBA model."""
+
+from __future__ import absolute_import, division, print_function
+
+import os
+import sys
+sys.path.append("/Users/lucascoppens/Documents/Phd/Active/Vnat modelling/Vnat_v5/RBA/RBApy")
+import rba
+
+# package imports
+import csv
+import itertools
+import multiprocessing
+import warnings
+import pandas as pd
+from model_cache import load_model
+from warm_solver import WarmStartSolver, InfeasibleError
+from efficiency_index import EfficiencyIndex
+
+# Every worker process loads the model once (lazily, see lazy_model) and reverts each knockout after solving
+_worker_index = None
+_worker_solver = None
+
+
+def _init_worker(model_dir):
+    global _worker_index, _worker_solver
+    model = load_model(model_dir, lazy=True)
+    _worker_index = EfficiencyIndex(model, strict=True)
+    _worker_solver = WarmStartSolver(model)
+
+
+# A knockout sets the forward and backward efficiency of its enzymes to 0, which
+# forces their fluxes to 0. That can only shrink the feasible space, so the
+# wild-type optimum caps the search: a neutral knockout costs one LP, at wt_mu.
+# A knockout that fails (e.g. an unknown id) gives NaN and its error message.
+def _solve_knockout(task):
+    knockout, wt_mu, bissection_tol = task
+    snapshot = _worker_index.snapshot()
+    try:
+        _worker_index.set(knockout, 0.0)
+        mu = _worker_solver.solve(mu_max=wt_mu, bissection_tol=bissection_tol, bracket=(wt_mu, wt_mu)).mu_opt
+    except InfeasibleError:
+        mu = 0.0
+    except Exception as error:
+        return knockout, float('nan'), '{}: {}'.format(type(error).__name__, error)
+    finally:
+        # also removes the efficiency functions the knockout created
+        _worker_index.restore(snapshot)
+    return knockout, mu, None
+
+
+def single_knockouts(model):
+    """One knockout per enzyme of the model."""
+    return [(enz.id,) for enz in model.enzymes.enzymes]
+
+
+def double_knockouts(ids):
+    """All pairs of the given enzyme/reaction ids."""
+    return list(itertools.combinations(ids, 2))
+
+
+def run_screen(knockouts, output_file, model_dir="model", processes=None, bissection_tol=1e-4):
+    """Solve every knockout in parallel and stream the results to output_file.
+
+    knockouts is a list of tuples of enzyme or reaction ids (see
+    EfficiencyIndex.rows). Each finished scenario is appended to the CSV
+    output_file right away. Returns the same rows as the CSV, wild type
+    first, as a DataFrame with the columns knockout, mu_opt and
+    growth_ratio (relative to wild type). Knockouts that fail, e.g.
+    because an id matches no enzyme, get NaN and a warning instead of
+    stopping the screen.
+    """
+    model = load_model(model_dir)
+    wt = WarmStartSolver(model).solve(bissection_tol=bissection_tol)
+    wt_mu = wt.mu_opt
+
+    tasks = [(tuple(knockout), wt_mu, bissection_tol) for knockout in knockouts]
+    rows = [['wild_type', wt_mu, 1.0]]
+    pool = multiprocessing.Pool(processes, initializer=_init_worker, initargs=(model_dir,))
+    try:
+        with open(output_file, 'w') as output:
+            writer = csv.writer(output)
+            writer.writerow(['knockout', 'mu_opt', 'growth_ratio'])
+            writer.writerow(rows[0])
+            for knockout, mu, error in pool.imap_unordered(_solve_knockout, tasks):
+                if error is not None:
+                    warnings.warn('knockout {} failed: {}'.format('+'.join(knockout), error))
+                row = ['+'.join(knockout), mu, mu / wt_mu]
+                writer.writerow(row)
+                output.flush()
+                rows.append(row)
+    finally:
+        pool.close()
+        pool.join()
+
+    return pd.DataFrame(rows, columns=['knockout', 'mu_opt', 'growth_ratio'])
+
+
+def main():
+    model = load_model("model")
+    results = run_screen(single_knockouts(model), "knockout_screen.csv")
+    print(results.sort_values('growth_ratio').head(20))
+
+if __name__ == '__main__':
+    main()
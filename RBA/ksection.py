@@ -0,0 +1,126 @@
+"""Growth-rate search that tests several mu candidates at once across a process pool."""
+
+from __future__ import absolute_import, division, print_function
+
+import os
+import sys
+sys.path.append("/Users/lucascoppens/Documents/Phd/Active/Vnat modelling/Vnat_v5/RBA/RBApy")
+import rba
+
+# package imports
+import multiprocessing
+import numpy as np
+from warm_solver import WarmStartSolver, InfeasibleError
+
+# Workers used when processes is not given. Every worker holds its own copy of
+# the model and LP, and a pool is only worth starting for large models.
+DEFAULT_PROCESSES = 4
+
+# Every worker process keeps its own warm-started LP for the whole search
+_worker_solver = None
+
+
+def _init_worker(model, compiled):
+    global _worker_solver
+    _worker_solver = WarmStartSolver(model, compiled=compiled)
+    _worker_solver.prepare()
+
+
+# Probes only report feasibility; the solution arrays are fetched once, at the end
+def _probe(mu):
+    return mu, _worker_solver.is_feasible(mu)
+
+
+def _solution(mu):
+    if not _worker_solver.is_feasible(mu):
+        return None
+    return _worker_solver._feasible[1:]
+
+
+class KSectionSolver(object):
+    """Growth-rate search that narrows the bracket by k + 1 per round instead of 2.
+
+    Every round, the first included, tests k evenly spaced growth rates
+    strictly inside the current bracket, initially (mu_min, mu_max), one LP
+    per worker, and keeps the interval between the largest feasible and the
+    smallest infeasible candidate. The ends are not probed: mu_min is only
+    solved when no candidate was feasible, by the final re-solve.
+    Reaching a tolerance takes log(k + 1) / log(2) times fewer rounds than
+    bisection, and the solution at mu_opt is re-solved once by a worker and
+    sent back. mu_opt ends within bissection_tol of the optimum, like
+    RbaModel.solve.
+
+    Every worker holds a copy of the model and starting the pool takes
+    seconds, so this only pays off for models whose LPs are slow and on
+    machines with free cores; otherwise WarmStartSolver is faster. processes
+    defaults to DEFAULT_PROCESSES (at most the number of cores).
+
+    The model is sent to the workers when the pool starts (on the first
+    solve); after changing the model, close() the solver and create a new
+    one. Use it as a context manager to shut the pool down.
+    """
+
+    def __init__(self, model, processes=None, compiled=False):
+        self.model = model
+        self.k = processes or min(DEFAULT_PROCESSES, multiprocessing.cpu_count())
+        self.compiled = compiled
+        self.matrix = None
+        self.mu_opt = self.X = self.lambda_ = None
+        self.n_rounds = self.n_probes = 0
+        self._pool = None
+
+    def _map(self, candidates):
+        self.n_probes += len(candidates)
+        return self._pool.map_async(_probe, candidates, chunksize=1)
+
+    def solve(self, mu_min=0, mu_max=2.5, bissection_tol=1e-6, max_rounds=None):
+        """Compute the maximal growth rate.
+
+        Returns an rba Results object; raises InfeasibleError if the
+        problem is infeasible at mu_min. When every candidate is feasible,
+        mu_opt ends within bissection_tol below mu_max.
+        """
+        if self._pool is None:
+            self._pool = multiprocessing.Pool(self.k, initializer=_init_worker,
+                                              initargs=(self.model, self.compiled))
+        self.mu_opt = self.X = self.lambda_ = None
+        self.n_rounds = self.n_probes = 0
+
+        lo, hi = mu_min, mu_max
+        # the parent builds its own matrix while the first round runs
+        pending = self._map(list(np.linspace(lo, hi, self.k + 2)[1:-1]))
+        if self.matrix is None:
+            self.matrix = rba.ConstraintMatrix(self.model)
+        while True:
+            results = sorted(pending.get())
+            self.n_rounds += 1
+            for mu, ok in results:
+                if ok and mu >= lo:
+                    lo = mu
+            hi = min([mu for mu, ok in results if not ok and mu > lo] + [hi])
+            if hi - lo <= bissection_tol or (max_rounds is not None and self.n_rounds >= max_rounds):
+                break
+            pending = self._map(list(np.linspace(lo, hi, self.k + 2)[1:-1]))
+
+        self.n_probes += 1
+        solution = self._pool.apply(_solution, (lo,))
+        if solution is None and lo == mu_min:
+            raise InfeasibleError('mu = mu_min = {} is infeasible, check matrix consistency.'.format(mu_min))
+        if solution is None:
+            raise RuntimeError('k-section: growth rate {} was feasible but failed to re-solve'.format(lo))
+        self.mu_opt = lo
+        self.X, self.lambda_ = solution
+        self.matrix.build_matrices(self.mu_opt)
+        return rba.Results(self.model, self.matrix, self)
+
+    def close(self):
+        if self._pool is not None:
+            self._pool.close()
+            self._pool.join()
+            self._pool = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
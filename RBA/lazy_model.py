@@ -0,0 +1,274 @@
+"""RBA model whose XML files are parsed on first access, with proteins held as a composition matrix."""
+
+from __future__ import absolute_import, division, print_function
+
+import os
+import sys
+sys.path.append("/Users/lucascoppens/Documents/Phd/Active/Vnat modelling/Vnat_v5/RBA/RBApy")
+import rba
+
+# package imports
+import numpy as np
+from lxml import etree
+
+# (attribute, rba.xml class, file) of every component RbaModel.from_xml reads; the
+# last three only exist in RBApy 3 models, which list their files in model_file_index.in
+COMPONENTS = (
+    ('metabolism', 'RbaMetabolism', 'metabolism.xml'),
+    ('density', 'RbaDensity', 'density.xml'),
+    ('parameters', 'RbaParameters', 'parameters.xml'),
+    ('proteins', 'RbaProteins', 'proteins.xml'),
+    ('enzymes', 'RbaEnzymes', 'enzymes.xml'),
+    ('rnas', 'RbaRNAs', 'rnas.xml'),
+    ('dna', 'RbaDNA', 'dna.xml'),
+    ('processes', 'RbaProcesses', 'processes.xml'),
+    ('targets', 'RbaTargets', 'targets.xml'),
+    ('compartments', 'RbaCompartments', 'compartments.xml'),
+    ('other_macromolecules', 'RbaMacromolecules', 'other_macromolecules.xml'),
+    ('custom_constraints', 'RbaCustomConstraints', 'custom_constraints.xml'),
+)
+
+
+def read_file_index(input_dir):
+    """File name per component ('medium' included) from input_dir/model_file_index.in, if any."""
+    names = {name: file_name for name, _, file_name in COMPONENTS}
+    names['medium'] = 'medium.tsv'
+    path = os.path.join(input_dir, 'model_file_index.in')
+    if os.path.isfile(path):
+        with open(path) as input_stream:
+            for line in input_stream:
+                if '=' in line:
+                    key, value = line.split('=', 1)
+                    names[key.strip()] = value.strip()
+    return names
+
+
+class _ReadOnly(object):
+    """Refuses attribute changes once freeze() has been called."""
+
+    _frozen = False
+
+    def freeze(self):
+        object.__setattr__(self, '_frozen', True)
+        return self
+
+    def _check_writable(self):
+        if self._frozen:
+            raise AttributeError('compact proteins are read-only, load the model with '
+                                 'compact_proteins=False to change them')
+
+    def __setattr__(self, name, value):
+        self._check_writable()
+        super(_ReadOnly, self).__setattr__(name, value)
+
+    def __delattr__(self, name):
+        self._check_writable()
+        super(_ReadOnly, self).__delattr__(name)
+
+
+class _ReadOnlyComponentReference(_ReadOnly, rba.xml.ComponentReference):
+    pass
+
+
+class _ReadOnlyComposition(_ReadOnly, rba.xml.Composition):
+
+    def append(self, element):
+        self._check_writable()
+        super(_ReadOnlyComposition, self).append(element)
+
+    def remove(self, element):
+        self._check_writable()
+        super(_ReadOnlyComposition, self).remove(element)
+
+
+class _ReadOnlyMacromolecule(_ReadOnly, rba.xml.Macromolecule):
+    pass
+
+
+class CompactMacromolecules(object):
+    """Read-only list of macromolecules backed by a dense composition matrix.
+
+    Stands in for the listOfMacromolecules of an rba.xml macromolecule
+    file: iterating or indexing builds rba.xml.Macromolecule objects on
+    the fly from one row of composition, so only the matrix and the ids
+    stay in memory. Those objects raise an AttributeError when changed,
+    as do append and remove, and the matrix itself is not writeable.
+    """
+
+    tag = 'listOfMacromolecules'
+
+    def __init__(self, component_ids, ids, compartments, composition, half_lives=None):
+        self.component_ids = list(component_ids)
+        self.ids = list(ids)
+        self.compartments = list(compartments)
+        self.composition = composition
+        self.half_lives = half_lives
+        self._index = {id_: i for i, id_ in enumerate(self.ids)}
+        self.composition.flags.writeable = False
+
+    # unpickled arrays are writeable again
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self.composition.flags.writeable = False
+
+    def _macromolecule(self, i):
+        row = self.composition[i]
+        composition = _ReadOnlyComposition()
+        for j in np.flatnonzero(row):
+            composition.append(_ReadOnlyComponentReference(self.component_ids[j], float(row[j])).freeze())
+        macromolecule = _ReadOnlyMacromolecule(self.ids[i], self.compartments[i])
+        macromolecule.composition = composition.freeze()
+        if self.half_lives is not None and self.half_lives[i] is not None:
+            macromolecule.half_life = self.half_lives[i]
+        return macromolecule.freeze()
+
+    def __getitem__(self, i):
+        if isinstance(i, slice):
+            return [self._macromolecule(j) for j in range(len(self))[i]]
+        return self._macromolecule(range(len(self))[i])
+
+    def __iter__(self):
+        return (self._macromolecule(i) for i in range(len(self)))
+
+    def __len__(self):
+        return len(self.ids)
+
+    def get_by_id(self, identifier):
+        i = self._index.get(identifier)
+        return None if i is None else self._macromolecule(i)
+
+    def is_empty(self):
+        return len(self.ids) == 0
+
+    def append(self, element):
+        raise AttributeError('compact proteins are read-only, load the model with '
+                             'compact_proteins=False to change them')
+
+    remove = append
+
+    def to_xml_node(self):
+        result = etree.Element(self.tag)
+        result.extend([m.to_xml_node() for m in self])
+        return result
+
+
+def read_compact(xml_class, file_name):
+    """Read a macromolecule XML file (e.g. proteins.xml) into xml_class with compact macromolecules.
+
+    The components are read as usual; the macromolecules become a
+    CompactMacromolecules whose composition matrix has one row per
+    macromolecule and one column per component.
+    """
+    root = etree.parse(file_name).getroot()
+    if root.tag != xml_class.tag:
+        raise ValueError('{}: expected <{}>, found <{}>'.format(file_name, xml_class.tag, root.tag))
+    result = xml_class()
+    result.components = rba.xml.ListOfComponents.from_xml_node(root.find('listOfComponents'))
+    component_ids = [c.id for c in result.components]
+    column = {id_: j for j, id_ in enumerate(component_ids)}
+
+    nodes = root.find('listOfMacromolecules').findall('macromolecule')
+    composition = np.zeros((len(nodes), len(component_ids)))
+    ids, compartments, half_lives = [], [], []
+    for i, node in enumerate(nodes):
+        ids.append(node.get('id'))
+        compartments.append(node.get('compartment'))
+        half_lives.append(node.get('half_life'))
+        for reference in node.iterfind('composition/componentReference'):
+            composition[i, column[reference.get('component')]] = float(reference.get('stoichiometry'))
+    if all(h is None for h in half_lives):
+        half_lives = None
+    result.macromolecules = CompactMacromolecules(component_ids, ids, compartments, composition, half_lives)
+    return result
+
+
+class _LazyComponent(object):
+    """Model attribute that reads its XML file the first time it is used."""
+
+    def __init__(self, name):
+        self.name = name
+
+    def __get__(self, model, owner):
+        if model is None:
+            return self
+        try:
+            return model.__dict__[self.name]
+        except KeyError:
+            pass
+        value = model._read_component(self.name)
+        model.__dict__[self.name] = value
+        return value
+
+    def __set__(self, model, value):
+        model.__dict__[self.name] = value
+
+
+class LazyRbaModel(rba.RbaModel):
+    """RbaModel that parses each component file on first access.
+
+    A job that only reads, say, the parameters never parses proteins.xml,
+    and building the constraint matrix parses each file once, when it is
+    needed. With compact_proteins, proteins.xml is read by read_compact:
+    compositions are one dense matrix (model.proteins.macromolecules.composition)
+    instead of a Python object per protein and amino acid, which is read-only.
+
+    unload() drops parsed components again, e.g. in a worker that has
+    compiled its constraint matrix and no longer needs them.
+    """
+
+    def __init__(self):
+        self._files = {}
+        self.compact_proteins = False
+        super(LazyRbaModel, self).__init__()
+
+    @classmethod
+    def from_xml(cls, input_dir, compact_proteins=True):
+        obj = cls()
+        obj.output_dir = input_dir
+        obj.compact_proteins = compact_proteins
+        file_names = read_file_index(input_dir)
+        for name, xml_class, _ in COMPONENTS:
+            path = os.path.join(input_dir, file_names[name])
+            if hasattr(rba.xml, xml_class) and os.path.isfile(path):
+                obj._files[name] = path
+                obj.__dict__.pop(name, None)
+        if hasattr(obj, 'get_metadata'):
+            obj.get_metadata(os.path.join(input_dir, 'metadata.tsv'))
+        obj.set_medium(os.path.join(input_dir, file_names['medium']))
+        return obj
+
+    def _read_component(self, name):
+        if name not in self._files:
+            raise AttributeError(name)
+        xml_class = getattr(rba.xml, dict((n, c) for n, c, _ in COMPONENTS)[name])
+        if name == 'proteins' and self.compact_proteins:
+            return read_compact(xml_class, self._files[name])
+        with open(self._files[name]) as input_stream:
+            return xml_class.from_file(input_stream)
+
+    def is_loaded(self, name):
+        return name in self.__dict__
+
+    def load_all(self):
+        """Parse every component that has not been read yet."""
+        for name in self._files:
+            getattr(self, name)
+
+    def unload(self, *names):
+        """Forget parsed components (all by default); they are read from file again on next use.
+
+        Changes made to an unloaded component since it was read are lost.
+        """
+        for name in names or list(self._files):
+            if name not in self._files:
+                raise ValueError('{} was not read from a file'.format(name))
+            self.__dict__.pop(name, None)
+
+    # pickled models (e.g. by model_cache) must not depend on the XML files
+    def __getstate__(self):
+        self.load_all()
+        return self.__dict__.copy()
+
+
+for _name, _, _ in COMPONENTS:
+    setattr(LazyRbaModel, _name, _LazyComponent(_name))
@@ -0,0 +1,93 @@
+"""Solve the RBA model for many medium compositions in parallel."""
+
+from __future__ import absolute_import, division, print_function
+
+import os
+import sys
+sys.path.append("/Users/lucascoppens/Documents/Phd/Active/Vnat modelling/Vnat_v5/RBA/RBApy")
+import rba
+
+# package imports
+import multiprocessing
+import pandas as pd
+from model_cache import load_model
+from warm_solver import WarmStartSolver, InfeasibleError
+from compiled_matrix import CompiledMatrix
+from sweep import check_fluxes
+
+# Every worker process loads the model lazily (see lazy_model), compiles the problem
+# once and only switches media afterwards
+_worker_model = None
+_worker_solver = None
+
+
+def _init_worker(model_dir):
+    global _worker_model, _worker_solver
+    _worker_model = load_model(model_dir, lazy=True)
+    _worker_solver = WarmStartSolver(_worker_model, compiled=True)
+    _worker_solver.matrix = CompiledMatrix(_worker_model)
+
+
+def read_media(file_name):
+    """Read a medium table: a Metabolite column followed by one concentration column per condition.
+
+    RBA/model/medium.tsv is the one-condition case.
+    """
+    return pd.read_csv(file_name, sep='\t', index_col=0)
+
+
+def condition_medium(base, media, condition):
+    """Medium dict for one condition: base with the condition's listed concentrations."""
+    medium = dict(base)
+    column = media[condition].dropna()
+    medium.update((metabolite, float(value)) for metabolite, value in column.items())
+    return medium
+
+
+def _solve_condition(task):
+    condition, medium, fluxes, solve_kwargs = task
+    _worker_solver.matrix.set_medium(medium)
+    try:
+        sol = _worker_solver.solve(recompute_matrices=False, **solve_kwargs)
+    except InfeasibleError:
+        sol = None
+    row = {'mu_opt': float('nan')}
+    if sol is not None:
+        rf = sol.reaction_fluxes()
+        row['mu_opt'] = sol.mu_opt
+        for reaction in fluxes:
+            row[reaction] = rf[reaction]
+    return condition, row
+
+
+def solve_media(media, fluxes=(), model_dir="model", processes=None, **solve_kwargs):
+    """Solve one RBA problem per medium condition across a process pool.
+
+    media is a DataFrame indexed by metabolite with one column per condition
+    (see read_media); metabolites a condition leaves out keep the
+    concentration from the model's own medium. Each worker compiles the
+    constraint matrix once, and a condition then only re-fits the
+    medium-dependent coefficients. Extra keyword arguments go to
+    WarmStartSolver.solve. Returns a DataFrame indexed by condition with
+    the columns mu_opt followed by the requested reaction fluxes; mu_opt is
+    NaN for conditions that are infeasible at mu_min. Unknown flux ids
+    raise a ValueError before any condition is solved.
+    """
+    fluxes = list(fluxes)
+    model = load_model(model_dir)
+    check_fluxes(model, fluxes)
+    base = model.medium
+    tasks = [(condition, condition_medium(base, media, condition), fluxes, solve_kwargs)
+             for condition in media.columns]
+    rows = {}
+
+    pool = multiprocessing.Pool(processes, initializer=_init_worker, initargs=(model_dir,))
+    try:
+        for condition, row in pool.imap_unordered(_solve_condition, tasks):
+            rows[condition] = row
+    finally:
+        pool.close()
+        pool.join()
+
+    table = pd.DataFrame.from_dict(rows, orient='index', columns=['mu_opt'] + fluxes)
+    return table.reindex(list(media.columns))
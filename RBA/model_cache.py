@@ -0,0 +1,106 @@
+"""Load the RBA model from a binary snapshot instead of re-parsing the XML files."""
+
+from __future__ import absolute_import, division, print_function
+
+import os
+import sys
+sys.path.append("/Users/lucascoppens/Documents/Phd/Active/Vnat modelling/Vnat_v5/RBA/RBApy")
+import rba
+
+# package imports
+import hashlib
+import pickle
+import tempfile
+from lazy_model import LazyRbaModel
+
+CACHE_VERSION = 1
+
+
+# The snapshot lives next to the model directory, e.g. RBA/model.cache.pickle
+def cache_path(model_dir):
+    return os.path.normpath(model_dir) + '.cache.pickle'
+
+
+def _file_hash(path):
+    digest = hashlib.sha1()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+# (mtime, size) per model file; cheap to compute on every load
+def _file_stats(model_dir):
+    stats = {}
+    for name in sorted(os.listdir(model_dir)):
+        path = os.path.join(model_dir, name)
+        if os.path.isfile(path):
+            st = os.stat(path)
+            stats[name] = (st.st_mtime_ns, st.st_size)
+    return stats
+
+
+def _read_header(path):
+    try:
+        with open(path, 'rb') as f:
+            return pickle.load(f)
+    except (OSError, EOFError, pickle.UnpicklingError):
+        return None
+
+
+# A snapshot is current if every file has the same mtime and size, or, when
+# only the mtime moved (checkout, copy), the same content hash.
+def _is_current(header, model_dir, stats):
+    if header is None or header.get('version') != CACHE_VERSION:
+        return False
+    if set(header['stats']) != set(stats):
+        return False
+    for name, stat in stats.items():
+        if header['stats'][name] == stat:
+            continue
+        if header['hashes'][name] != _file_hash(os.path.join(model_dir, name)):
+            return False
+    return True
+
+
+def write_cache(model, model_dir):
+    stats = _file_stats(model_dir)
+    header = {
+        'version': CACHE_VERSION,
+        'stats': stats,
+        'hashes': {name: _file_hash(os.path.join(model_dir, name)) for name in stats},
+    }
+    # write to a temporary file first so concurrent jobs never read a partial snapshot
+    path = cache_path(model_dir)
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(os.path.abspath(path)))
+    with os.fdopen(fd, 'wb') as f:
+        pickle.dump(header, f, pickle.HIGHEST_PROTOCOL)
+        pickle.dump(model, f, pickle.HIGHEST_PROTOCOL)
+    os.replace(tmp_path, path)
+
+
+def load_model(model_dir="model", lazy=False):
+    """Drop-in replacement for rba.RbaModel.from_xml(model_dir).
+
+    The parsed model is pickled next to model_dir and reused for as long as
+    the files in model_dir are unchanged. With lazy, the snapshot is not
+    used: a LazyRbaModel is returned that parses each file when first
+    needed and keeps protein compositions as one matrix.
+    """
+    if lazy:
+        return LazyRbaModel.from_xml(model_dir)
+    path = cache_path(model_dir)
+    stats = _file_stats(model_dir)
+    header = _read_header(path)
+    if _is_current(header, model_dir, stats):
+        with open(path, 'rb') as f:
+            pickle.load(f)
+            model = pickle.load(f)
+        # refresh the stored mtimes so the next load skips the hashing
+        if header['stats'] != stats:
+            write_cache(model, model_dir)
+        return model
+
+    model = rba.RbaModel.from_xml(model_dir)
+    write_cache(model, model_dir)
+    return model
@@ -0,0 +1,160 @@
+"""Evaluate all parameters.xml functions and aggregates in one vectorized call."""
+
+from __future__ import absolute_import, division, print_function
+
+# package imports
+import numpy as np
+
+CONSTANT, LINEAR, EXPONENTIAL, MICHAELIS_MENTEN, INDICATOR = range(5)
+
+FUNCTION_TYPES = {
+    'constant': CONSTANT,
+    'linear': LINEAR,
+    'exponential': EXPONENTIAL,
+    'michaelisMenten': MICHAELIS_MENTEN,
+    'indicator': INDICATOR,
+}
+
+
+def _value(fn, parameter_id, default):
+    for parameter in fn.parameters:
+        if parameter.id == parameter_id:
+            return float(parameter.value)
+    return default
+
+
+# medium.tsv lists M_cpd00023 while functions use the variable M_cpd00023_e
+def medium_value(medium, variable):
+    if variable in medium:
+        return medium[variable]
+    return medium[variable.rsplit('_', 1)[0]]
+
+
+class ParameterArrays(object):
+    """The model's parameter functions compiled into flat NumPy arrays.
+
+    Each function is stored as a type code, two coefficients (a, b), and
+    the X_MIN/X_MAX/Y_MIN/Y_MAX clamps:
+
+        constant         a
+        linear           clip(a + b * clip(x, X_MIN, X_MAX), Y_MIN, Y_MAX)
+        exponential      a * exp(b * x)
+        michaelisMenten  max(a * x^n / (b^n + x^n), Y_MIN)   n = HILL_COEFFICIENT (1)
+        indicator        X_MIN < x < X_MAX
+
+    x is the growth rate, or the medium concentration for functions whose
+    variable is a medium metabolite. Multiplication aggregates are the
+    product of their functions, each raised to its reference's exponent.
+    Aggregates of aggregates raise a ValueError. Values are taken from the
+    model at compile time, so call from_model() again after changing
+    parameters.
+    """
+
+    def __init__(self, model, medium=None):
+        functions = list(model.parameters.functions)
+        aggregates = list(model.parameters.aggregates)
+        n = len(functions)
+
+        self.function_ids = [fn.id for fn in functions]
+        self.aggregate_ids = [agg.id for agg in aggregates]
+        self.ids = self.function_ids + self.aggregate_ids
+        self.index = {id_: i for i, id_ in enumerate(self.ids)}
+
+        self.type_code = np.empty(n, dtype=np.int8)
+        self.a = np.zeros(n)
+        self.b = np.zeros(n)
+        self.hill = np.ones(n)
+        self.x_min = np.full(n, -np.inf)
+        self.x_max = np.full(n, np.inf)
+        self.y_min = np.full(n, -np.inf)
+        self.y_max = np.full(n, np.inf)
+        self.variables = [fn.variable for fn in functions]
+        self.is_growth_rate = np.array([v == 'growth_rate' for v in self.variables], dtype=bool)
+
+        for i, fn in enumerate(functions):
+            if fn.type not in FUNCTION_TYPES:
+                raise ValueError('Unsupported function type {} for {}'.format(fn.type, fn.id))
+            code = FUNCTION_TYPES[fn.type]
+            self.type_code[i] = code
+            if code == CONSTANT:
+                self.a[i] = _value(fn, 'CONSTANT', 0.0)
+            elif code == LINEAR:
+                self.a[i] = _value(fn, 'LINEAR_CONSTANT', 0.0)
+                self.b[i] = _value(fn, 'LINEAR_COEF', 0.0)
+            elif code == EXPONENTIAL:
+                self.a[i] = _value(fn, 'MULTIPLIER', 1.0) * np.exp(_value(fn, 'CONSTANT', 0.0))
+                self.b[i] = _value(fn, 'RATE', 0.0)
+            elif code == MICHAELIS_MENTEN:
+                self.a[i] = _value(fn, 'kmax', 0.0)
+                self.b[i] = _value(fn, 'Km', 0.0)
+                self.hill[i] = _value(fn, 'HILL_COEFFICIENT', 1.0)
+            self.x_min[i] = _value(fn, 'X_MIN', -np.inf)
+            self.x_max[i] = _value(fn, 'X_MAX', np.inf)
+            self.y_min[i] = _value(fn, 'Y_MIN', -np.inf)
+            self.y_max[i] = _value(fn, 'Y_MAX', np.inf)
+
+        # aggregates as a flat list of function indices plus start offsets
+        function_index = {id_: i for i, id_ in enumerate(self.function_ids)}
+        refs, exponents, starts = [], [], []
+        for agg in aggregates:
+            if agg.type != 'multiplication':
+                raise ValueError('Unsupported aggregate type {} for {}'.format(agg.type, agg.id))
+            if len(getattr(agg, 'aggregate_references', ())):
+                raise ValueError('Unsupported aggregate references in {}'.format(agg.id))
+            starts.append(len(refs))
+            for ref in agg.function_references:
+                refs.append(function_index[ref.function])
+                exponents.append(float(getattr(ref, 'exponent', 1.0)))
+        self.aggregate_refs = np.array(refs, dtype=np.intp)
+        self.aggregate_exponents = np.array(exponents)
+        self.aggregate_starts = np.array(starts, dtype=np.intp)
+
+        self.set_medium(model.medium if medium is None else medium)
+
+    @classmethod
+    def from_model(cls, model, medium=None):
+        return cls(model, medium)
+
+    def set_medium(self, medium):
+        """Fix the x value of every medium-dependent function."""
+        self.x_medium = np.array([0.0 if g else medium_value(medium, v)
+                                  for v, g in zip(self.variables, self.is_growth_rate)])
+
+    def evaluate(self, mu):
+        """Values of all functions then aggregates, in the order of self.ids.
+
+        mu is a scalar (returns shape (n,)) or a 1-D array of growth rates
+        (returns shape (n, len(mu))).
+        """
+        scalar = np.ndim(mu) == 0
+        mu = np.atleast_1d(np.asarray(mu, dtype=float))
+        x = np.where(self.is_growth_rate[:, None], mu[None, :], self.x_medium[:, None])
+
+        a, b, hill = self.a[:, None], self.b[:, None], self.hill[:, None]
+        x_min, x_max = self.x_min[:, None], self.x_max[:, None]
+        code = self.type_code[:, None]
+        with np.errstate(divide='ignore', invalid='ignore', over='ignore'):
+            linear = np.clip(a + b * np.clip(x, x_min, x_max), self.y_min[:, None], self.y_max[:, None])
+            exponential = a * np.exp(b * x)
+            x_hill = x ** hill
+            michaelis = np.maximum(np.where(x != 0, a * x_hill / (b ** hill + x_hill), 0.0), self.y_min[:, None])
+            indicator = ((x > x_min) & (x < x_max)).astype(float)
+        values = np.select(
+            [code == CONSTANT, code == LINEAR, code == EXPONENTIAL, code == MICHAELIS_MENTEN],
+            [np.broadcast_to(a, x.shape), linear, exponential, michaelis],
+            indicator)
+
+        if len(self.aggregate_starts):
+            # a zero operand gives zero whatever its exponent, as in rba
+            operands = values[self.aggregate_refs]
+            with np.errstate(divide='ignore', invalid='ignore', over='ignore'):
+                operands = np.where(operands != 0, operands ** self.aggregate_exponents[:, None], 0.0)
+            products = np.multiply.reduceat(operands, self.aggregate_starts, axis=0)
+            values = np.vstack([values, products])
+        return values[:, 0] if scalar else values
+
+    def breakpoints(self):
+        """Growth rates where a growth-rate function changes slope (clamp edges)."""
+        mask = self.is_growth_rate & np.isin(self.type_code, (LINEAR, INDICATOR))
+        edges = np.concatenate([self.x_min[mask], self.x_max[mask]])
+        return np.unique(edges[np.isfinite(edges)])
@@ -0,0 +1,176 @@
+"""Cached model build stages that only re-run when their inputs change."""
+
+from __future__ import absolute_import, division, print_function
+
+import os
+import sys
+sys.path.append("/Users/lucascoppens/Documents/Phd/Active/Vnat modelling/Vnat_v5/RBA/RBApy")
+import rba
+
+# package imports
+import filecmp
+import hashlib
+import importlib
+import inspect
+import logging
+import pickle
+import shutil
+import tempfile
+
+logger = logging.getLogger(__name__)
+
+
+def _file_hash(path):
+    digest = hashlib.sha1()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+# Every file under path (a file or a directory), skipping hidden entries
+def _input_files(path):
+    if os.path.isfile(path):
+        return [path]
+    if not os.path.isdir(path):
+        return []
+    files = []
+    for root, dirs, names in os.walk(path):
+        dirs[:] = sorted(d for d in dirs if not d.startswith('.'))
+        files.extend(os.path.join(root, name) for name in sorted(names) if not name.startswith('.'))
+    return files
+
+
+class Stage(object):
+    """One step of the model build.
+
+    func takes the model produced by the previous stage (None for the first
+    one) and returns the model for the next stage. inputs are the files or
+    directories the stage reads; exclude lists files inside those
+    directories that belong to a later stage. depends lists the modules
+    (or module names) of the helpers func calls, e.g. efficiency_index;
+    their source files are part of the key like func's own source. Bump
+    version to force a re-run for any other change, e.g. of a library.
+    A stage re-runs when its inputs, its code, its dependencies, its
+    version or any earlier stage changed.
+    """
+
+    def __init__(self, name, func, inputs=(), exclude=(), cache=True, depends=(), version=None):
+        self.name = name
+        self.func = func
+        self.inputs = list(inputs)
+        self.exclude = set(os.path.normpath(path) for path in exclude)
+        self.cache = cache
+        self.depends = [importlib.import_module(module) if isinstance(module, str) else module
+                        for module in depends]
+        self.version = version
+
+    def key(self, previous_key):
+        digest = hashlib.sha1()
+        digest.update(previous_key.encode())
+        digest.update(self.name.encode())
+        digest.update(inspect.getsource(self.func).encode())
+        digest.update(repr(self.version).encode())
+        for module in self.depends:
+            digest.update(module.__name__.encode())
+            digest.update(_file_hash(inspect.getsourcefile(module)).encode())
+        for path in self.inputs:
+            digest.update(path.encode())
+            for file_name in _input_files(path):
+                if os.path.normpath(file_name) in self.exclude:
+                    continue
+                digest.update(file_name.encode())
+                digest.update(_file_hash(file_name).encode())
+        return digest.hexdigest()
+
+
+class Pipeline(object):
+    """Run a list of stages, resuming from the last cached stage that is still current.
+
+    The output of every stage with cache=True is pickled to
+    <cache_dir>/<stage name>.pickle together with its key.
+    """
+
+    def __init__(self, stages, cache_dir='.stages'):
+        self.stages = stages
+        self.cache_dir = cache_dir
+
+    def _path(self, stage):
+        return os.path.join(self.cache_dir, stage.name + '.pickle')
+
+    def _stored_key(self, stage):
+        try:
+            with open(self._path(stage), 'rb') as f:
+                return pickle.load(f)
+        except (OSError, EOFError, pickle.UnpicklingError):
+            return None
+
+    def _load(self, stage):
+        with open(self._path(stage), 'rb') as f:
+            pickle.load(f)
+            return pickle.load(f)
+
+    def _store(self, stage, key, model):
+        if not os.path.isdir(self.cache_dir):
+            os.makedirs(self.cache_dir)
+        fd, tmp_path = tempfile.mkstemp(dir=self.cache_dir)
+        with os.fdopen(fd, 'wb') as f:
+            pickle.dump(key, f, pickle.HIGHEST_PROTOCOL)
+            pickle.dump(model, f, pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp_path, self._path(stage))
+
+    def run(self):
+        """Return the model of the last stage, re-running only what is out of date.
+
+        Progress is logged to the 'pipeline' logger at INFO level.
+        """
+        # keys only depend on the inputs, so the resume point can be found
+        # before anything is loaded
+        keys, key = [], ''
+        for stage in self.stages:
+            key = stage.key(key)
+            keys.append(key)
+        start = 0
+        for i, stage in enumerate(self.stages):
+            if stage.cache and self._stored_key(stage) == keys[i]:
+                start = i + 1
+
+        if start:
+            logger.info('Resuming from cached stage %s', self.stages[start - 1].name)
+        model = self._load(self.stages[start - 1]) if start else None
+        key = keys[start - 1] if start else ''
+        for stage in self.stages[start:]:
+            logger.info('Running stage %s', stage.name)
+            model = stage.func(model)
+            # stages may create helper files among their own inputs
+            key = stage.key(key)
+            if stage.cache:
+                self._store(stage, key, model)
+        return model
+
+
+def write_changed(model, output_dir):
+    """Write the model to output_dir, replacing only the files whose content changed.
+
+    Unchanged files keep their mtime, so model_cache snapshots stay valid.
+    Returns the relative paths of the files that were written.
+    """
+    parent = os.path.dirname(os.path.abspath(output_dir))
+    tmp_dir = tempfile.mkdtemp(dir=parent)
+    previous_dir = model.output_dir
+    written = []
+    try:
+        model.write(tmp_dir)
+        for file_name in _input_files(tmp_dir):
+            rel_path = os.path.relpath(file_name, tmp_dir)
+            target = os.path.join(output_dir, rel_path)
+            if os.path.isfile(target) and filecmp.cmp(file_name, target, shallow=False):
+                continue
+            if not os.path.isdir(os.path.dirname(target)):
+                os.makedirs(os.path.dirname(target))
+            os.replace(file_name, target)
+            written.append(rel_path)
+    finally:
+        model.output_dir = previous_dir
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+    return written
@@ -0,0 +1,150 @@
+"""Protein sequences and amino-acid compositions read once into NumPy arrays."""
+
+from __future__ import absolute_import, division, print_function
+
+import os
+import sys
+sys.path.append("/Users/lucascoppens/Documents/Phd/Active/Vnat modelling/Vnat_v5/RBA/RBApy")
+import rba
+
+# package imports
+import functools
+import hashlib
+import pickle
+import tempfile
+import numpy as np
+import pandas as pd
+
+AMINO_ACIDS = 'ACDEFGHIKLMNPQRSTVWY'
+CACHE_VERSION = 1
+
+
+def _file_hash(path):
+    digest = hashlib.sha1()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def encode_sequences(sequences):
+    """All sequences as one uint8 buffer plus offsets: sequence i is buffer[offsets[i]:offsets[i + 1]]."""
+    encoded = [s.encode('ascii') for s in sequences]
+    lengths = np.fromiter((len(s) for s in encoded), dtype=np.int64, count=len(encoded))
+    offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+    np.cumsum(lengths, out=offsets[1:])
+    return np.frombuffer(b''.join(encoded), dtype=np.uint8), offsets
+
+
+def composition_matrix(buffer, offsets, alphabet=AMINO_ACIDS):
+    """Count every letter of alphabet in every sequence; one row per sequence."""
+    n = len(offsets) - 1
+    owner = np.repeat(np.arange(n), np.diff(offsets))
+    counts = np.bincount(owner * 256 + buffer, minlength=n * 256).reshape(n, 256)
+    return counts[:, np.frombuffer(alphabet.encode('ascii'), dtype=np.uint8)].astype(np.int32)
+
+
+class ProteinTable(object):
+    """Contents of protein_summary.tsv and subunits.tsv with sequences as arrays.
+
+    composition[i, j] is the count of amino acid alphabet[j] in protein
+    ids[i], and lengths[i] its sequence length. The other summary columns
+    are kept as a DataFrame (info), the subunit stoichiometries as a Series
+    indexed by entry (subunits).
+    """
+
+    def __init__(self, summary, subunits=None, alphabet=AMINO_ACIDS):
+        sequences = summary['SEQUENCE'].fillna('').astype(str)
+        self.ids = list(summary['IDENTIFIER'])
+        self.alphabet = alphabet
+        self.buffer, self.offsets = encode_sequences(sequences)
+        self.lengths = np.diff(self.offsets)
+        self.composition = composition_matrix(self.buffer, self.offsets, alphabet)
+        self.info = summary.drop(columns='SEQUENCE').set_index('IDENTIFIER')
+        self.subunits = subunits
+
+    def __len__(self):
+        return len(self.ids)
+
+    def sequence(self, i):
+        return self.buffer[self.offsets[i]:self.offsets[i + 1]].tobytes().decode('ascii')
+
+
+def _cache_path(summary_file):
+    # hidden, so the model build pipeline does not count it as an input
+    directory, name = os.path.split(summary_file)
+    return os.path.join(directory, '.' + name + '.cache.pickle')
+
+
+def read_protein_table(summary_file='data/protein_summary.tsv', subunits_file='data/subunits.tsv'):
+    """Read the protein summary (and subunits, if present) into a ProteinTable.
+
+    The table is pickled next to summary_file and reused as long as both
+    files keep the same content hash.
+    """
+    files = [summary_file] + ([subunits_file] if subunits_file and os.path.isfile(subunits_file) else [])
+    key = (CACHE_VERSION, [_file_hash(path) for path in files])
+    path = _cache_path(summary_file)
+    try:
+        with open(path, 'rb') as f:
+            if pickle.load(f) == key:
+                return pickle.load(f)
+    except (OSError, EOFError, pickle.UnpicklingError):
+        pass
+
+    summary = pd.read_csv(summary_file, sep='\t', dtype={'SEQUENCE': str})
+    subunits = None
+    if len(files) > 1:
+        subunits = pd.read_csv(subunits_file, sep='\t', index_col='ENTRY')['STOICHIOMETRY']
+    table = ProteinTable(summary, subunits)
+
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(os.path.abspath(path)))
+    with os.fdopen(fd, 'wb') as f:
+        pickle.dump(key, f, pickle.HIGHEST_PROTOCOL)
+        pickle.dump(table, f, pickle.HIGHEST_PROTOCOL)
+    os.replace(tmp_path, path)
+    return table
+
+
+# Protein.composition of rba.prerba.macromolecule, with the amino-acid counts
+# taken from row of table instead of counting the sequence
+def _table_composition(protein, table, row):
+    composition = dict(zip(table.alphabet, table.composition[row].tolist()))
+    for cofactor in protein.cofactors:
+        composition[cofactor.chebi] = cofactor.stoichiometry
+    return composition
+
+
+class PrecomputedModelBuilder(rba.ModelBuilder):
+    """rba.ModelBuilder that takes protein compositions from a ProteinTable.
+
+    When the proteins are built, every protein whose id is in table with
+    the same sequence gets its amino-acid counts from the table; the others
+    are counted by rba as usual. Only this builder's protein objects are
+    changed, so builders for other tables can run side by side.
+    """
+
+    def __init__(self, parameter_file, table, verbose=False):
+        super(PrecomputedModelBuilder, self).__init__(parameter_file, verbose=verbose)
+        self.table = table
+        self._rows = {}
+        for i, id_ in enumerate(table.ids):
+            self._rows.setdefault(id_, i)
+
+    def _use_table(self, protein):
+        row = self._rows.get(protein.id)
+        if row is not None and self.table.sequence(row) == protein.sequence:
+            protein.composition = functools.partial(_table_composition, protein, self.table, row)
+
+    def build_proteins(self):
+        machinery = getattr(self, 'process_machinery_components', {}).get('Proteins', [])
+        for protein in list(self.data.enzymatic_localised_proteins) + list(machinery):
+            self._use_table(protein)
+        return super(PrecomputedModelBuilder, self).build_proteins()
+
+
+def model_from_data(params_file, table, verbose=False):
+    """rba.RbaModel.from_data(params_file), with protein compositions taken from table."""
+    builder = PrecomputedModelBuilder(params_file, table, verbose=verbose)
+    builder.export_proteins('helper_files/protein_summary.tsv')
+    return builder.build_model()
@@ -0,0 +1,22 @@
+"""Reaction id lists shared by the analysis scripts."""
+
+# TCA cycle and respiratory chain, scanned together in acetate_fullox_tradeoff.py
+# and grid_scan.py
+tca_resp_reactions = [
+        "rxn00256_c",
+        "rxn00973_c",
+        "rxn00198_c",
+        "rxn08094_c",
+        "rxn00285_c",
+        "rxn00288_c",
+        "rxn00799_c",
+        "rxn00935_c", # no enzyme in the RBA model, skipped by EfficiencyIndex
+        "rxn10042_c", # ATP synthase
+        # "rxn30509_c", # Na-OAD
+        "rxn37569_c", # Na-NQR
+        "rxn10113_c", # cytochrome bo3
+        "rxn10806_c", # cytochrome bd
+        "rxn14426_c", # cytochrome cbb3
+        "rxn35348_c", # cytochrome bc1
+        "rxn19357_c", # cytochrome aa3
+    ]
@@ -0,0 +1,217 @@
+"""Columnar on-disk store for many RBA solutions.
+
+A store is a directory with a header.json (reaction, enzyme, process and
+label ids, fixed when the store is created) and one sub-directory per chunk
+of rows. Each chunk holds one .npy array per column group (mu_opt, labels,
+fluxes, enzymes, processes), stored column by column (columns x rows), so a
+single column is one contiguous block that can be memory-mapped and read
+without touching the rest.
+"""
+
+from __future__ import absolute_import, division, print_function
+
+import os
+import json
+import shutil
+import tempfile
+import threading
+import numpy as np
+import pandas as pd
+
+STORE_VERSION = 2
+GROUPS = ('fluxes', 'enzymes', 'processes')
+
+
+def model_columns(model):
+    """Reaction, enzyme and process ids of a model, in the order rba reports them."""
+    return {
+        'fluxes': [r.id for r in model.metabolism.reactions],
+        'enzymes': [e.id for e in model.enzymes.enzymes],
+        'processes': [p.id for p in model.processes.processes],
+    }
+
+
+def solution_vectors(results, columns):
+    """Fluxes, enzyme and process machinery concentrations of an rba Results as arrays."""
+    variables = results.variables
+    return (
+        np.array([variables[i] for i in columns['fluxes']]),
+        np.array([variables.get(i, 0.0) for i in columns['enzymes']]),
+        np.array([variables[i + '_machinery'] for i in columns['processes']]),
+    )
+
+
+def _write_json(path, data):
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(os.path.abspath(path)))
+    with os.fdopen(fd, 'w') as f:
+        json.dump(data, f)
+    os.replace(tmp_path, path)
+
+
+class ResultSink(object):
+    """Append solutions to a store as they come in.
+
+    Rows are buffered and written as a chunk once chunk_size rows are
+    waiting, and a background thread writes whatever is buffered every
+    flush_interval seconds, so slow solves reach the disk one by one and a
+    crash loses at most flush_interval seconds of results. The header only
+    lists complete chunks, so a store that is being written (or whose
+    writer crashed) can always be read. labels are extra numeric columns
+    given per row, e.g. the swept parameter value.
+
+    A path that already holds results is only replaced with overwrite;
+    otherwise FileExistsError is raised.
+    """
+
+    def __init__(self, path, columns, labels=(), chunk_size=64, flush_interval=10.0, overwrite=False):
+        self.path = path
+        self.columns = columns
+        self.labels = list(labels)
+        self.chunk_size = chunk_size
+        self.flush_interval = flush_interval
+        self.header = {
+            'version': STORE_VERSION,
+            'labels': self.labels,
+            'chunks': [],
+        }
+        self.header.update({group: list(columns[group]) for group in GROUPS})
+        self._buffer = []
+        if not os.path.isdir(path):
+            os.makedirs(path)
+        chunks = [name for name in os.listdir(path) if name.startswith('chunk_')]
+        if chunks and not overwrite:
+            raise FileExistsError('{} already holds results; pass overwrite=True to replace them'.format(path))
+        for name in chunks:
+            shutil.rmtree(os.path.join(path, name))
+        _write_json(os.path.join(path, 'header.json'), self.header)
+
+        self._lock = threading.Lock()
+        self._closed = threading.Event()
+        self._timer = None
+        if flush_interval is not None:
+            self._timer = threading.Thread(target=self._flush_periodically, daemon=True)
+            self._timer.start()
+
+    @classmethod
+    def for_model(cls, path, model, labels=(), chunk_size=64, flush_interval=10.0, overwrite=False):
+        return cls(path, model_columns(model), labels, chunk_size, flush_interval, overwrite)
+
+    def _flush_periodically(self):
+        while not self._closed.wait(self.flush_interval):
+            self.flush()
+
+    def append(self, results, **labels):
+        """Add one rba Results (or None for an infeasible point, stored as NaN)."""
+        if results is None:
+            self.append_vectors(float('nan'), None, **labels)
+        else:
+            self.append_vectors(results.mu_opt, solution_vectors(results, self.columns), **labels)
+
+    def append_vectors(self, mu_opt, vectors, **labels):
+        """Add one row from arrays ordered like the header (see solution_vectors)."""
+        if vectors is None:
+            vectors = tuple(np.full(len(self.header[group]), np.nan) for group in GROUPS)
+        with self._lock:
+            self._buffer.append((mu_opt, [labels.get(label, np.nan) for label in self.labels], vectors))
+            full = len(self._buffer) >= self.chunk_size
+        if full:
+            self.flush()
+
+    def flush(self):
+        """Write the buffered rows as a new chunk."""
+        with self._lock:
+            if not self._buffer:
+                return
+            rows, self._buffer = self._buffer, []
+            name = 'chunk_{:05d}'.format(len(self.header['chunks']))
+            chunk_dir = os.path.join(self.path, name)
+            if not os.path.isdir(chunk_dir):
+                os.makedirs(chunk_dir)
+            # columns x rows, so that every column is contiguous on disk
+            np.save(os.path.join(chunk_dir, 'mu_opt.npy'), np.array([row[0] for row in rows], dtype=float))
+            np.save(os.path.join(chunk_dir, 'labels.npy'),
+                    np.array([row[1] for row in rows], dtype=float).reshape(len(rows), -1).T.copy())
+            for g, group in enumerate(GROUPS):
+                np.save(os.path.join(chunk_dir, group + '.npy'), np.column_stack([row[2][g] for row in rows]))
+            self.header['chunks'].append({'name': name, 'rows': len(rows)})
+            _write_json(os.path.join(self.path, 'header.json'), self.header)
+
+    def close(self):
+        self._closed.set()
+        if self._timer is not None:
+            self._timer.join()
+            self._timer = None
+        self.flush()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+class ResultStore(object):
+    """Read access to a store written by ResultSink."""
+
+    def __init__(self, path):
+        self.path = path
+        with open(os.path.join(path, 'header.json')) as f:
+            self.header = json.load(f)
+        if self.header.get('version') != STORE_VERSION:
+            raise ValueError('Unsupported result store version: {}'.format(self.header.get('version')))
+        self.labels = self.header['labels']
+        self._index = {}
+        for group in GROUPS:
+            for i, id_ in enumerate(self.header[group]):
+                self._index.setdefault(id_, (group, i))
+        for i, label in enumerate(self.labels):
+            self._index[label] = ('labels', i)
+        self._index['mu_opt'] = ('mu_opt', None)
+
+    @property
+    def reactions(self):
+        return self.header['fluxes']
+
+    @property
+    def enzymes(self):
+        return self.header['enzymes']
+
+    @property
+    def processes(self):
+        return self.header['processes']
+
+    def __len__(self):
+        return sum(chunk['rows'] for chunk in self.header['chunks'])
+
+    def _load(self, chunk, group):
+        return np.load(os.path.join(self.path, chunk['name'], group + '.npy'), mmap_mode='r')
+
+    def group(self, group):
+        """Full array of one column group ('mu_opt', 'labels', 'fluxes', ...), rows stacked over chunks."""
+        arrays = [self._load(chunk, group) for chunk in self.header['chunks']]
+        if not arrays:
+            return np.empty(0)
+        if group == 'mu_opt':
+            return np.concatenate(arrays)
+        return np.concatenate(arrays, axis=1).T
+
+    def read(self, columns):
+        """DataFrame with the given columns (mu_opt, labels, reaction/enzyme/process ids).
+
+        Only the requested columns are copied out of the memory-mapped chunks.
+        """
+        by_group = {}
+        for column in columns:
+            group, i = self._index[column]
+            by_group.setdefault(group, []).append((column, i))
+        data = {}
+        for group, entries in by_group.items():
+            if group == 'mu_opt':
+                data['mu_opt'] = np.array(self.group('mu_opt'))
+                continue
+            parts = [np.asarray(self._load(chunk, group)[[i for _, i in entries]])
+                     for chunk in self.header['chunks']]
+            values = np.concatenate(parts, axis=1) if parts else np.empty((len(entries), 0))
+            for k, (column, _) in enumerate(entries):
+                data[column] = values[k]
+        return pd.DataFrame(data, columns=list(columns))
@@ -9,19 +9,35 @@ sys.path.append("/Users/lucascoppens/Documents/Phd/Active/Vnat modelling/Vnat_v5
 
 # package imports
 import rba
+import argparse
 import re
 import copy
 import numpy as np
 import pandas as pd
+from model_cache import load_model
+from result_store import ResultSink
+from warm_solver import WarmStartSolver
+from ksection import KSectionSolver
 
 
 
 def main():
-    model = rba.RbaModel.from_xml("model")
-
-    res = model.solve(bissection_tol = 0.01)
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--ksection', action='store_true',
+                        help='search mu with KSectionSolver across a process pool (pays off for large models only)')
+    parser.add_argument('--processes', type=int, help='k-section workers (default: ksection.DEFAULT_PROCESSES)')
+    args = parser.parse_args()
+    model = load_model("model")
+
+    if args.ksection:
+        with KSectionSolver(model, processes=args.processes) as solver:
+            res = solver.solve(bissection_tol = 0.01)
+    else:
+        res = WarmStartSolver(model).solve(bissection_tol = 0.01)
 
     res.write_fluxes('fluxes.csv', file_type="csv")
+    with ResultSink.for_model('solve_model.results', model, overwrite=True) as sink:
+        sink.append(res)
     print("Growth rate: ", res.mu_opt)
 
 if __name__ == '__main__':
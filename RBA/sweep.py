@@ -0,0 +1,230 @@
+"""Solve the RBA model for a list of parameter assignments in parallel."""
+
+from __future__ import absolute_import, division, print_function
+
+import os
+import sys
+sys.path.append("/Users/lucascoppens/Documents/Phd/Active/Vnat modelling/Vnat_v5/RBA/RBApy")
+import rba
+
+# package imports
+import multiprocessing
+import pandas as pd
+from model_cache import load_model
+from warm_solver import WarmStartSolver, InfeasibleError
+from efficiency_index import EfficiencyIndex
+from result_store import ResultSink, model_columns, solution_vectors
+
+# Half-width of the mu bracket taken around the previous point of a warm-started sweep
+BRACKET_WIDTH = 0.05
+
+# SolveProfile attributes added to the table when a sweep is profiled
+PROFILE_COLUMNS = ['n_lp', 'n_bisection_iters', 'setup_time', 'build_time', 'lp_time', 'nnz']
+
+# Every worker process loads the model once (lazily, see lazy_model) and keeps it here between points
+_worker_model = None
+_worker_solver = None
+_worker_columns = None
+_worker_last_mu = None
+_worker_index = None
+
+
+def _init_worker(model_dir):
+    global _worker_model, _worker_solver, _worker_columns, _worker_index
+    _worker_model = load_model(model_dir, lazy=True)
+    _worker_index = None
+    _worker_solver = WarmStartSolver(_worker_model, compiled=True)
+    _worker_columns = model_columns(_worker_model)
+
+
+# An assignment maps a parameters.xml function to a new value. Keys are either
+# a function id (its CONSTANT parameter is set) or a (function id, parameter id) tuple.
+def get_parameter(model, key):
+    if isinstance(key, tuple):
+        function_id, parameter_id = key
+    else:
+        function_id, parameter_id = key, 'CONSTANT'
+    fn = model.parameters.functions.get_by_id(function_id)
+    return fn.parameters.get_by_id(parameter_id)
+
+
+def check_fluxes(model, fluxes):
+    """Raise a ValueError naming every id of fluxes that is not a reaction of model."""
+    reactions = set(r.id for r in model.metabolism.reactions)
+    unknown = [reaction for reaction in fluxes if reaction not in reactions]
+    if unknown:
+        raise ValueError('unknown reactions in fluxes: {}'.format(', '.join(unknown)))
+
+
+# Apply an assignment and return the values it replaced, so it can be reverted
+def apply_assignment(model, assignment):
+    previous = {}
+    for key, value in assignment.items():
+        parameter = get_parameter(model, key)
+        previous[key] = parameter.value
+        parameter.value = value
+    return previous
+
+
+# Dedicated efficiency functions (EfficiencyIndex.function_ids) only exist in the
+# model they were materialized in; create the ones an assignment needs in the
+# worker's model and return a snapshot that removes them again
+def _materialize(assignment):
+    global _worker_index
+    functions = _worker_model.parameters.functions
+    missing = [key for key in assignment if not isinstance(key, tuple) and functions.get_by_id(key) is None]
+    if not missing:
+        return None
+    if _worker_index is None:
+        _worker_index = EfficiencyIndex(_worker_model)
+    snapshot = _worker_index.snapshot()
+    _worker_index.materialize(missing)
+    return snapshot
+
+
+def _solve_point(task):
+    global _worker_last_mu
+    index, assignment, fluxes, warm_start, profile, vectors, solve_kwargs = task
+    snapshot = _materialize(assignment)
+    previous = apply_assignment(_worker_model, assignment)
+    try:
+        if warm_start:
+            bracket = None
+            if _worker_last_mu is not None:
+                bracket = (_worker_last_mu - BRACKET_WIDTH, _worker_last_mu + BRACKET_WIDTH)
+            try:
+                sol = _worker_solver.solve(bracket=bracket, profile=profile, **solve_kwargs)
+            except InfeasibleError:
+                sol = None
+        else:
+            sol = _worker_model.solve(**solve_kwargs)
+        row = {'mu_opt': float('nan')}
+        if sol is not None:
+            _worker_last_mu = sol.mu_opt
+            rf = sol.reaction_fluxes()
+            row['mu_opt'] = sol.mu_opt
+            for reaction in fluxes:
+                row[reaction] = rf[reaction]
+            if vectors:
+                row['_vectors'] = solution_vectors(sol, _worker_columns)
+        if profile:
+            row.update({column: getattr(_worker_solver.profile, column) for column in PROFILE_COLUMNS})
+    finally:
+        # leave the worker model as loaded for the next point
+        apply_assignment(_worker_model, previous)
+        if snapshot is not None:
+            _worker_index.restore(snapshot)
+    return index, row
+
+
+class SweepPool(object):
+    """Sweep workers kept alive across several sweeps.
+
+    Every worker loads the model and compiles its solver once. Passing the
+    same SweepPool as pool to iter_sweep or run_sweep, e.g. for the rounds
+    of an adaptive scan, reuses them instead of starting a new pool per
+    call. Use it as a context manager to shut the workers down.
+    """
+
+    def __init__(self, model_dir="model", processes=None):
+        self.model_dir = model_dir
+        self.processes = processes or multiprocessing.cpu_count()
+        self._model = None
+        self._pool = multiprocessing.Pool(self.processes, initializer=_init_worker, initargs=(model_dir,))
+
+    @property
+    def model(self):
+        """The model as the workers load it (loaded in this process on first use)."""
+        if self._model is None:
+            self._model = load_model(self.model_dir)
+        return self._model
+
+    def close(self):
+        if self._pool is not None:
+            self._pool.close()
+            self._pool.join()
+            self._pool = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+def iter_sweep(assignments, fluxes=(), model_dir="model", processes=None, warm_start=False, profile=False,
+               vectors=False, chunksize=None, pool=None, **solve_kwargs):
+    """Solve the assignments like run_sweep, yielding (index, row) as points finish.
+
+    row is a dict with mu_opt, the fluxes and, with profile, the
+    PROFILE_COLUMNS. With vectors, it also holds the full solution arrays
+    under '_vectors' (see result_store.solution_vectors). chunksize is the
+    number of consecutive assignments given to a worker at once; results of
+    a chunk only come back when the whole chunk is done. By default warm
+    started sweeps use one chunk per worker. Unknown flux ids raise a
+    ValueError before any point is solved. With pool (a SweepPool), the
+    points run on its workers and model_dir and processes are taken from
+    it; otherwise a pool is started for this sweep only.
+    """
+    if profile and not warm_start:
+        raise ValueError('profile requires warm_start')
+    fluxes = list(fluxes)
+    if fluxes:
+        check_fluxes(pool.model if pool is not None else load_model(model_dir), fluxes)
+    tasks = [(i, assignment, fluxes, warm_start, profile, vectors, solve_kwargs)
+             for i, assignment in enumerate(assignments)]
+
+    own_pool = pool is None
+    if own_pool:
+        pool = SweepPool(model_dir, processes)
+    if chunksize is None:
+        chunksize = 1
+        if warm_start:
+            chunksize = max(1, len(tasks) // pool.processes)
+
+    try:
+        for index, row in pool._pool.imap_unordered(_solve_point, tasks, chunksize):
+            yield index, row
+    finally:
+        if own_pool:
+            pool.close()
+
+
+def run_sweep(assignments, fluxes=(), model_dir="model", processes=None, warm_start=False, profile=False,
+              store=None, pool=None, overwrite=False, **solve_kwargs):
+    """Solve one RBA problem per assignment across a process pool.
+
+    Extra keyword arguments are passed on to RbaModel.solve. With warm_start,
+    each worker solves with a WarmStartSolver instead, and consecutive
+    assignments are sent to the same worker so each point starts from a mu
+    bracket around its neighbour's optimum. Returns a DataFrame with one row
+    per assignment (in input order) and the columns mu_opt followed by the
+    requested reaction fluxes. With profile (requires warm_start), the
+    columns of PROFILE_COLUMNS from each point's SolveProfile are appended.
+
+    With store (a directory), every point's full fluxes, enzyme and process
+    allocations are streamed into a result_store as points finish, with
+    the assignment's position as the 'index' label; an existing store is
+    only replaced with overwrite. pool is an optional SweepPool to run on
+    (see iter_sweep).
+    """
+    fluxes = list(fluxes)
+    rows = [None] * len(assignments)
+    sink = None
+    if store is not None:
+        model = pool.model if pool is not None else load_model(model_dir)
+        sink = ResultSink.for_model(store, model, labels=['index'], overwrite=overwrite)
+
+    try:
+        for index, row in iter_sweep(assignments, fluxes, model_dir, processes, warm_start, profile,
+                                     vectors=sink is not None, pool=pool, **solve_kwargs):
+            vectors = row.pop('_vectors', None)
+            if sink is not None:
+                sink.append_vectors(row['mu_opt'], vectors, index=index)
+            rows[index] = row
+    finally:
+        if sink is not None:
+            sink.close()
+
+    columns = ['mu_opt'] + fluxes + (PROFILE_COLUMNS if profile else [])
+    return pd.DataFrame(rows, columns=columns)
@@ -0,0 +1,356 @@
+"""Growth-rate bisection that keeps one LP alive between mu probes."""
+
+from __future__ import absolute_import, division, print_function
+
+import os
+import sys
+sys.path.append("/Users/lucascoppens/Documents/Phd/Active/Vnat modelling/Vnat_v5/RBA/RBApy")
+import rba
+
+# package imports
+import collections
+import time
+import numpy as np
+from compiled_matrix import CompiledMatrix
+
+# HiGHS keeps its basis when coefficients are changed in place, which is what
+# makes the warm start work. Without highspy (or with another lp_solver),
+# WarmStartSolver probes go through rba's own LP solver, as in RbaModel.solve,
+# and LinearProblem falls back to a cold linprog solve.
+try:
+    import highspy
+except ImportError:
+    highspy = None
+    from scipy.optimize import linprog
+
+
+def _row_bounds(b, row_signs):
+    b = np.asarray(b, dtype=float)
+    signs = np.asarray(row_signs)
+    lower = np.where(signs == 'L', -np.inf, b)
+    upper = np.where(signs == 'G', np.inf, b)
+    return lower, upper
+
+
+class LinearProblem(object):
+    """LP built once from a constraint matrix and updated in place afterwards."""
+
+    def __init__(self, matrix):
+        self.X = self.lambda_ = None
+        self.n_solves = 0
+        self._highs = None
+        self._load(matrix)
+
+    def _load(self, matrix):
+        self.A = matrix.A.tocsr()
+        self.row_lower, self.row_upper = _row_bounds(matrix.b, matrix.row_signs)
+        self.LB = np.array(matrix.LB, dtype=float)
+        self.UB = np.array(matrix.UB, dtype=float)
+        self.f = np.array(matrix.f, dtype=float)
+        if highspy is None:
+            return
+        A = self.A.tocsc()
+        lp = highspy.HighsLp()
+        lp.num_col_ = A.shape[1]
+        lp.num_row_ = A.shape[0]
+        lp.col_cost_ = self.f
+        lp.col_lower_ = self.LB
+        lp.col_upper_ = self.UB
+        lp.row_lower_ = self.row_lower
+        lp.row_upper_ = self.row_upper
+        lp.a_matrix_.format_ = highspy.MatrixFormat.kColwise
+        lp.a_matrix_.start_ = A.indptr
+        lp.a_matrix_.index_ = A.indices
+        lp.a_matrix_.value_ = A.data
+        self._highs = highspy.Highs()
+        self._highs.setOptionValue('output_flag', False)
+        self._highs.passModel(lp)
+
+    def update(self, matrix):
+        """Push the entries of matrix that differ from the current LP.
+
+        Returns the number of changed matrix coefficients.
+        """
+        A = matrix.A.tocsr()
+        if A.shape != self.A.shape:
+            self._load(matrix)
+            return A.nnz
+        if np.array_equal(A.indptr, self.A.indptr) and np.array_equal(A.indices, self.A.indices):
+            # same sparsity pattern (e.g. a CompiledMatrix): compare the data directly
+            changed = np.flatnonzero(A.data != self.A.data)
+            diff_rows = np.searchsorted(A.indptr, changed, side='right') - 1
+            diff_cols, values = A.indices[changed], A.data[changed]
+        else:
+            diff = (A - self.A).tocsr()
+            diff.eliminate_zeros()
+            diff = diff.tocoo()
+            diff_rows, diff_cols = diff.row, diff.col
+            values = np.asarray(A[diff_rows, diff_cols]).ravel()
+
+        row_lower, row_upper = _row_bounds(matrix.b, matrix.row_signs)
+        LB = np.array(matrix.LB, dtype=float)
+        UB = np.array(matrix.UB, dtype=float)
+        f = np.array(matrix.f, dtype=float)
+        rows = np.flatnonzero((row_lower != self.row_lower) | (row_upper != self.row_upper))
+        cols = np.flatnonzero((LB != self.LB) | (UB != self.UB))
+        costs = np.flatnonzero(f != self.f)
+
+        if self._highs is not None:
+            for i, j, value in zip(diff_rows, diff_cols, values):
+                self._highs.changeCoeff(int(i), int(j), float(value))
+            if len(rows):
+                self._highs.changeRowsBounds(len(rows), rows, row_lower[rows], row_upper[rows])
+            if len(cols):
+                self._highs.changeColsBounds(len(cols), cols, LB[cols], UB[cols])
+            if len(costs):
+                self._highs.changeColsCost(len(costs), costs, f[costs])
+
+        self.A = A
+        self.row_lower, self.row_upper = row_lower, row_upper
+        self.LB, self.UB, self.f = LB, UB, f
+        return len(values)
+
+    def solve(self):
+        """Solve the LP; returns True if it is feasible."""
+        self.n_solves += 1
+        if self._highs is not None:
+            self._highs.run()
+            if self._highs.getModelStatus() != highspy.HighsModelStatus.kOptimal:
+                return False
+            sol = self._highs.getSolution()
+            self.X = np.array(sol.col_value)
+            self.lambda_ = np.array(sol.row_dual)
+            return True
+        return self._solve_linprog()
+
+    def _solve_linprog(self):
+        eq = np.flatnonzero(self.row_lower == self.row_upper)
+        up = np.flatnonzero((self.row_lower != self.row_upper) & np.isfinite(self.row_upper))
+        lo = np.flatnonzero((self.row_lower != self.row_upper) & np.isfinite(self.row_lower))
+        A_ub = self.A[np.concatenate([up, lo])]
+        A_ub = A_ub.multiply(np.concatenate([np.ones(len(up)), -np.ones(len(lo))])[:, None]).tocsr()
+        b_ub = np.concatenate([self.row_upper[up], -self.row_lower[lo]])
+        res = linprog(self.f, A_ub=A_ub, b_ub=b_ub, A_eq=self.A[eq], b_eq=self.row_lower[eq],
+                      bounds=np.column_stack([self.LB, self.UB]), method='highs')
+        if res.status != 0:
+            return False
+        self.X = res.x
+        self.lambda_ = np.zeros(self.A.shape[0])
+        self.lambda_[eq] = res.eqlin.marginals
+        self.lambda_[up] += res.ineqlin.marginals[:len(up)]
+        self.lambda_[lo] -= res.ineqlin.marginals[len(up):]
+        return True
+
+
+class InfeasibleError(ValueError):
+    """The problem is infeasible at mu_min; the ValueError RbaModel.solve raises then."""
+
+
+# One growth-rate probe: the mu tested, whether the LP was feasible, the time
+# spent building the matrix and pushing it into the LP, and the LP solve time
+Probe = collections.namedtuple('Probe', ['mu', 'feasible', 'build_time', 'lp_time'])
+
+
+class SolveProfile(object):
+    """Where the time of one WarmStartSolver.solve call went.
+
+    setup_time covers constructing the ConstraintMatrix from the model,
+    final_build_time the rebuild at mu_opt; every LP is one entry of probes.
+    """
+
+    def __init__(self):
+        self.setup_time = 0.0
+        self.final_build_time = 0.0
+        self.probes = []
+        self.n_bisection_iters = 0
+        self.n_rows = self.n_cols = self.nnz = None
+        self.mu_opt = None
+
+    @property
+    def build_time(self):
+        return self.setup_time + self.final_build_time + sum(p.build_time for p in self.probes)
+
+    @property
+    def lp_time(self):
+        return sum(p.lp_time for p in self.probes)
+
+    @property
+    def n_lp(self):
+        return len(self.probes)
+
+    def as_dict(self):
+        """Plain dict (e.g. for JSON), with the probes as a list of dicts."""
+        return {
+            'mu_opt': self.mu_opt,
+            'n_rows': self.n_rows,
+            'n_cols': self.n_cols,
+            'nnz': self.nnz,
+            'setup_time': self.setup_time,
+            'build_time': self.build_time,
+            'lp_time': self.lp_time,
+            'n_lp': self.n_lp,
+            'n_bisection_iters': self.n_bisection_iters,
+            'probes': [p._asdict() for p in self.probes],
+        }
+
+
+class WarmStartSolver(object):
+    """Bisection on growth rate that reuses one LP across probes and solves.
+
+    Between probes only the mu-dependent coefficients are written into the
+    LP, and the LP solver restarts from the previous basis. The same solver
+    can be reused after model parameters change (e.g. during a sweep).
+
+    With compiled, the constraint matrix is a CompiledMatrix: mu probes
+    then skip rba's matrix assembly (except for coefficients it could not
+    compile), and a re-solve after a parameter change costs three assemblies
+    instead of one per probe.
+
+    The warm start needs highspy. Without it, or when lp_solver names one
+    of rba's LP solvers ('cplex', 'glpk', ...), every probe builds a fresh
+    LP with that solver, exactly as RbaModel.solve does.
+    """
+
+    def __init__(self, model, compiled=False, lp_solver=None):
+        self.model = model
+        self.compiled = compiled
+        self.lp_solver = lp_solver
+        self.warm = highspy is not None and lp_solver in (None, 'highs')
+        self.matrix = None
+        self.mu_opt = self.X = self.lambda_ = None
+        self.n_probes = 0
+        self.n_bisection_iters = 0
+        self._lp = None
+        self._rba_solver = None
+        self._feasible = None
+        self.profile = None
+
+    def _build(self, mu):
+        self.matrix.build_matrices(mu)
+        if not self.warm:
+            if self._rba_solver is None or self._rba_solver.matrix is not self.matrix:
+                self._rba_solver = rba.Solver(self.matrix, lp_solver=self.lp_solver)
+            self._rba_solver.lp_solver.build_lp()
+        elif self._lp is None:
+            self._lp = LinearProblem(self.matrix)
+        else:
+            self._lp.update(self.matrix)
+
+    def _solve_lp(self, mu):
+        if self.warm:
+            feasible = self._lp.solve()
+            return feasible, self._lp.X, self._lp.lambda_
+        lp = self._rba_solver.lp_solver
+        lp.solve_lp()
+        if lp.is_feasible():
+            lp.store_results(mu)
+            return True, self._rba_solver.X, np.asarray(self._rba_solver.lambda_, dtype=float)
+        if not lp.is_infeasible():
+            raise ValueError(self._rba_solver.unknown_flag_msg(mu))
+        return False, None, None
+
+    def is_feasible(self, mu):
+        start = time.perf_counter()
+        self._build(mu)
+        built = time.perf_counter()
+        self.n_probes += 1
+        feasible, X, lambda_ = self._solve_lp(mu)
+        if self.profile is not None:
+            self.profile.probes.append(Probe(mu, feasible, built - start, time.perf_counter() - built))
+        if feasible:
+            self._feasible = (mu, X, lambda_)
+        return feasible
+
+    # Widen a guessed bracket until lo is feasible and hi is not; a model
+    # that is feasible at mu_max gives the bracket (mu_max, mu_max)
+    def _find_bracket(self, lo, hi, mu_min, mu_max, bissection_tol):
+        lo, hi = max(lo, mu_min), min(hi, mu_max)
+        step = max(hi - lo, bissection_tol)
+        while not self.is_feasible(lo):
+            if lo <= mu_min:
+                return None, None
+            hi = lo
+            lo = max(mu_min, lo - step)
+            step *= 2
+        if hi <= lo and lo >= mu_max:
+            return lo, lo
+        while self.is_feasible(hi):
+            if hi >= mu_max:
+                return hi, hi
+            lo = hi
+            hi = min(mu_max, hi + step)
+            step *= 2
+        return lo, hi
+
+    def prepare(self, recompute_matrices=True):
+        """Set up the constraint matrix for is_feasible; solve() calls this itself."""
+        if self.matrix is None:
+            self.matrix = CompiledMatrix(self.model) if self.compiled else rba.ConstraintMatrix(self.model)
+        elif recompute_matrices:
+            if self.compiled:
+                self.matrix.refresh()
+            else:
+                self.matrix = rba.ConstraintMatrix(self.model)
+
+    def solve(self, mu_min=0, mu_max=2.5, bissection_tol=1e-6, bracket=None,
+              max_bissection_iters=None, recompute_matrices=True, profile=False, callback=None):
+        """Compute the maximal growth rate.
+
+        bracket is an optional (lo, hi) guess, typically taken around the
+        mu_opt of a neighbouring sweep point; it is widened if it turns out
+        not to contain the optimum. Returns an rba Results object; raises
+        InfeasibleError (a ValueError, like RbaModel.solve) if the problem is
+        infeasible at mu_min.
+
+        With profile (or a callback), a SolveProfile of this call is stored
+        as .profile on the solver and on the returned Results, and
+        callback(profile) is called once the solve is done, also when it is
+        infeasible.
+        """
+        self.profile = SolveProfile() if profile or callback is not None else None
+        start = time.perf_counter()
+        self.prepare(recompute_matrices)
+        if self.profile is not None:
+            self.profile.setup_time = time.perf_counter() - start
+        self._feasible = None
+        self.mu_opt = self.X = self.lambda_ = None
+        self.n_bisection_iters = 0
+
+        results = self._bisect(mu_min, mu_max, bissection_tol, bracket, max_bissection_iters)
+        if self.profile is not None:
+            self.profile.mu_opt = self.mu_opt
+            self.profile.n_bisection_iters = self.n_bisection_iters
+            self.profile.n_rows, self.profile.n_cols = self.matrix.A.shape
+            self.profile.nnz = self.matrix.A.nnz
+            if results is not None:
+                results.profile = self.profile
+            if callback is not None:
+                callback(self.profile)
+        if results is None:
+            raise InfeasibleError('mu = mu_min = {} is infeasible, check matrix consistency.'.format(mu_min))
+        return results
+
+    def _bisect(self, mu_min, mu_max, bissection_tol, bracket, max_bissection_iters):
+        lo, hi = bracket if bracket is not None else (mu_min, mu_max)
+        lo, hi = self._find_bracket(lo, hi, mu_min, mu_max, bissection_tol)
+        if lo is None:
+            return None
+
+        iters = 0
+        while hi - lo > bissection_tol:
+            if max_bissection_iters is not None and iters >= max_bissection_iters:
+                break
+            mu_test = (lo + hi) / 2
+            if self.is_feasible(mu_test):
+                lo = mu_test
+            else:
+                hi = mu_test
+            iters += 1
+            self.n_bisection_iters = iters
+
+        self.mu_opt, self.X, self.lambda_ = self._feasible
+        start = time.perf_counter()
+        self.matrix.build_matrices(self.mu_opt)
+        if self.profile is not None:
+            self.profile.final_build_time = time.perf_counter() - start
+        return rba.Results(self.model, self.matrix, self)